@@ -22,13 +22,15 @@ Add, check or remove bar checks in selected music.
 """
 
 from __future__ import unicode_literals
-from __future__ import print_function
 
+import bisect
 import collections
 import itertools
 
 import ly.document
 import ly.lex.lilypond
+import ly.music.event
+import ly.music.items
 
 
 def remove(cursor):
@@ -55,105 +57,267 @@ def remove(cursor):
             prv, cur = cur, nxt
 
 
-class event(object):
-    """A limited event type at a certain time."""
+# the items a bar check may be inserted before
+_insert_before = (
+    ly.music.items.Durable,
+    ly.music.items.Music,
+    ly.music.items.TimeSignature,
+    ly.music.items.KeySignature,
+    ly.music.items.Partial,
+    ly.music.items.Clef,
+    ly.music.items.Tempo,
+    ly.music.items.Set,
+    ly.music.items.Unset,
+    ly.music.items.Override,
+    ly.music.items.Revert,
+)
 
-    def __init__(self):
-        self._nodes = []
-        self.cadenza = None
-        self.barcheck = False
-        self.timesig = None
-        self.partial = None
+# the commands a bar check may be inserted before
+_insert_before_commands = (
+    '\\cadenzaOn',
+    '\\cadenzaOff',
+    '\\bar',
+    '\\break',
+    '\\pageBreak',
+    '\\mark',
+)
 
-    def append(self, node):
-        self._nodes.append(node)
 
-    def __repr__(self):
-        s = []
-        if self.cadenza is not None:
-            s.append('cadenza' + ('On' if self.cadenza else 'Off'))
-        if self.barcheck:
-            s.append('bar')
-        if self.timesig is not None:
-            s.append('T{0}'.format(self.timesig))
-        if self.partial is not None:
-            s.append('P{0}'.format(self.partial))
-        if self._nodes:
-            s.append(repr(self._nodes))
-        return '<event {0}>'.format(' '.join(s))
+def _may_insert_before(node):
+    """Return True if a bar check may be inserted before the node.
 
+    Not before an \\alternative command, its braces or one of the
+    alternatives, because the alternatives would then be detached from the
+    repeat or get an extra alternative. The music inside an alternative can
+    get a bar check.
 
-def insert(cursor, music=None):
-    """Insert bar checks within the selected range."""
-    if music is None:
-        import ly.music
-        music = ly.music.document(cursor.document)
+    """
+    if not (isinstance(node, _insert_before) or (
+            isinstance(node, ly.music.items.Command)
+            and node.token in _insert_before_commands)):
+        return False
+    for n in itertools.islice(itertools.chain((node,), node.ancestors()), 3):
+        if isinstance(n, ly.music.items.Alternative):
+            return False
+    return True
 
-    if len(music) == 0:
-        return
 
-    if cursor.start:
-        n = music.node(cursor.start, 1)
-        nodes = itertools.chain((n,), n.forward())
-    else:
-        nodes = music
-    if cursor.end is None:
-        iter_nodes = iter
-    else:
-        def predicate(node): return node.position < cursor.end
+class Timeline(ly.music.event.MeasureIndex):
+    """A MeasureIndex that also records the bar checks in a music expression.
 
-        def iter_nodes(it):
-            return itertools.takewhile(predicate, it)
+    Every voice (each child of a simultaneous expression or \\partcombine
+    command) gets a number, the outer voice has number 0.
 
-    # make time-based lists of events
-    event_lists = []
+    barchecks   a list of (time, voice, node) tuples for every PipeSymbol
+    starts      a dict mapping (time, voice) to a tuple (order, position)
+                for the first item in the voice starting at that time,
+                before which a bar check could be inserted
+    references  the set of values of variables that are referred to
+    occurrences a Counter with the number of times an item at a position,
+                before which a bar check could be inserted, is read (e.g.
+                more than once in a repeat that is unfolded)
 
-    def do_topnode(node):
-        if not isinstance(node, ly.music.items.Music):
-            for n in node:
-                do_topnode(n)
-            return
-
-        def do_node(node, time, scaling):
-            if isinstance(node, (ly.music.items.Durable, ly.music.items.UserCommand)):
-                if node.position >= cursor.start:
-                    events[time].append(node)
-                time += node.length() * scaling
-            elif isinstance(node, ly.music.items.TimeSignature):
-                events[time].timesig = node.measure_length()
-            elif isinstance(node, ly.music.items.Partial):
-                events[time].partial = node.length()
-            elif isinstance(node, ly.music.items.PipeSymbol):
-                events[time].barcheck = True
-            elif isinstance(node, ly.music.items.Command) and node.token in (
-                    'cadenzaOn', 'cadenzaOff'):
-                events[time].cadenza = node.token == 'cadenzaOn'
-            elif isinstance(node, ly.music.items.Grace):
-                pass
-            elif isinstance(node, ly.music.items.LyricMode):
-                pass
-            elif isinstance(node, ly.music.items.MusicList) and node.simultaneous:
-                time = max(do_node(n, time, scaling) for n in iter_nodes(node))
-            elif isinstance(node, ly.music.items.Music):
-                if isinstance(node, ly.music.items.Scaler):
-                    scaling *= node.scaling
-                for n in iter_nodes(node):
-                    time = do_node(n, time, scaling)
-            else:
-                do_topnode(node)
+    Music in variables that are referred to is recorded as well, but only
+    items from the document of the node are recorded.
+
+    The times are in the units of the Events class we inherit from.
+
+    """
+    def __init__(self, node):
+        self.barchecks = []
+        self.starts = {}
+        self.references = set()
+        self.occurrences = collections.Counter()
+        self._document = node.document
+        self._parents = [None]      # the parent voice of every voice
+        self._voice = 0
+        ly.music.event.MeasureIndex.__init__(self, node)
+
+    def traverse(self, node, time, scaling):
+        """Traverse node, recording bar checks and the starts of items."""
+        if isinstance(node, ly.music.items.LyricMode):
             return time
+        if node.document is self._document:
+            if isinstance(node, ly.music.items.PipeSymbol):
+                self.barchecks.append((time, self._voice, node))
+            elif _may_insert_before(node):
+                key = time, self._voice
+                if key not in self.starts:
+                    self.starts[key] = len(self.starts), node.position
+                self.occurrences[node.position] += 1
+        if ((isinstance(node, ly.music.items.MusicList) and node.simultaneous)
+                or isinstance(node, ly.music.items.PartCombine)):
+            voice = self._voice
+            end = time
+            for n in node:
+                self._voice = len(self._parents)
+                self._parents.append(voice)
+                end = max(end, self.traverse(n, time, scaling))
+            self._voice = voice
+            return end
+        elif isinstance(node, ly.music.items.UserCommand):
+            value = node.value()
+            if value is not None:
+                self.references.add(value)
+        return super(Timeline, self).traverse(node, time, scaling)
+
+    def measure_starts(self):
+        """Return the set of times a bar check may be at."""
+        starts = set(self._starts)
+        if self._next == self._end:
+            starts.add(self._end)   # a bar check at the end of the music
+        if self.first == 0:
+            starts.discard(0)   # the start of a pickup measure
+        return starts
+
+    def insertions(self):
+        """Yield the positions where a bar check is missing.
+
+        A bar check is missing at the first item starting at a measure start
+        in every voice, unless there is one already, or an enclosing voice
+        has an item starting there earlier. If the item is read more than
+        once, it must be at the start of a measure every time.
+
+        """
+        starts = self.measure_starts()
+        starts.discard(0)
+        checked = set((time, voice) for time, voice, node in self.barchecks)
+        found = collections.Counter()
+        for (time, voice), (order, position) in self.starts.items():
+            if time in starts and (time, voice) not in checked:
+                parent = self._parents[voice]
+                while parent is not None:
+                    if (time, parent) in checked or self.starts.get((time, parent), (order,)) < (order,):
+                        break
+                    parent = self._parents[parent]
+                else:
+                    found[position] += 1
+        for position, count in found.items():
+            if count == self.occurrences[position]:
+                yield position
+
+    def misplaced(self):
+        """Yield the PipeSymbol nodes that are not at the start of a measure.
+
+        A bar check inside a cadenza is at the time the cadenza started.
+
+        """
+        starts = self.measure_starts()
+        cadenzas, ends = [], []     # the start and end times of cadenzas
+        for time, command, value in sorted(self._timing, key=lambda t: t[0]):
+            if command == 'cadenza':
+                if value and len(cadenzas) == len(ends):
+                    cadenzas.append(time)
+                elif not value and len(cadenzas) > len(ends):
+                    ends.append(time)
+        for time, voice, node in self.barchecks:
+            i = bisect.bisect_right(cadenzas, time) - 1
+            if i >= 0 and (i == len(ends) or ends[i] >= time):
+                time = cadenzas[i]
+            if time not in starts:
+                yield node
+
+
+class TickTimeline(Timeline, ly.music.event.TickMeasureIndex):
+    """A Timeline that computes with integer ticks."""
+    def __init__(self, node, unit):
+        ly.music.event.TickEvents.__init__(self, unit)
+        Timeline.__init__(self, node)
+
 
-        events = collections.defaultdict(event)
-        do_node(node, 0, 1)
-        event_lists.append(sorted(events.items()))
+def _timelines(music):
+    """Yield a Timeline for every music expression in the music Document.
 
-    do_topnode(nodes)
+    Music in variables is read where it is used, so timing commands in
+    other variables that are used simultaneously are taken into account.
+    The value of a variable that is not used is read on its own.
 
-    for event_list in event_lists:
+    """
+    expressions = []    # the toplevel expressions
+    values = []         # the values of assignments
 
-        # default to 4/4 without pickup
-        measure_length = 1
-        measure_pos = 0
+    def find(node, lis):
+        if isinstance(node, ly.music.items.Music):
+            lis.append(node)
+        elif not isinstance(node, ly.music.items.Durable):
+            for n in node:
+                find(n, values if isinstance(n, ly.music.items.Assignment) else lis)
+
+    find(music, expressions)
+    # references point backwards, so read the values from the end
+    expressions.extend(reversed(values))
+    references = set()
+    for node in expressions:
+        if node not in references:
+            try:
+                timeline = TickTimeline(node, music.tick_resolution())
+            except ValueError:
+                timeline = Timeline(node)   # fall back to Fractions
+            references.update(timeline.references)
+            yield timeline
+
+
+def _in_range(cursor, position):
+    """Return True if the position is in the cursor's range."""
+    return cursor.start <= position and (cursor.end is None or position < cursor.end)
+
+
+def insert(cursor, music=None):
+    """Insert bar checks within the selected range.
+
+    The music is read into a ly.music.items.Document if not given. The
+    measures are computed for every music expression (see
+    ly.music.event.MeasureIndex), and a bar check is inserted at the start
+    of every measure that does not have one, in every voice. Music in a
+    variable gets the measures of the place where it is used. All bar
+    checks are inserted at once.
+
+    """
+    d = cursor.document
+    if music is None:
+        music = ly.music.document(d)
+    changes = []
+    for timeline in _timelines(music):
+        for pos in timeline.insertions():
+            if _in_range(cursor, pos):
+                changes.append(_insertion(d, pos))
+    with d:
+        d.write_blocks(sorted(set(changes)))
 
-        for time, evt in event_list:
-            print(time, evt)
+
+def _insertion(document, pos):
+    """Return a (start, end, text) change that inserts a bar check before pos.
+
+    If the item at pos starts a line, the bar check is appended to the
+    previous line (if that does not end with a comment).
+
+    """
+    block = document.block(pos)
+    if not document.text(block)[:pos - document.position(block)].strip():
+        prev = document.previous_block(block)
+        if document.isvalid(prev):
+            for t in reversed(document.tokens(prev)):
+                if not isinstance(t, ly.lex.Space):
+                    if not isinstance(t, ly.lex.Comment):
+                        end = document.position(prev) + t.end
+                        return end, end, " |"
+                    break
+    return pos, pos, "| "
+
+
+def check(cursor, music=None):
+    """Return a list of the bar checks in the selected range that are misplaced.
+
+    The list contains the ly.music.items.PipeSymbol nodes (with the position
+    attribute) of the bar checks that are not at the start of a measure, in
+    the order of the document.
+
+    """
+    if music is None:
+        music = ly.music.document(cursor.document)
+    nodes = {}
+    for timeline in _timelines(music):
+        for node in timeline.misplaced():
+            if _in_range(cursor, node.position):
+                nodes[node.position] = node
+    return [nodes[pos] for pos in sorted(nodes)]
@@ -75,6 +75,7 @@ from __future__ import absolute_import
 
 import io
 import sys
+import bisect
 import operator
 import collections
 import weakref
@@ -108,6 +109,13 @@ class DocumentBase(object):
     blocks_forward
     blocks_backward
     state
+    block_cache
+    checkpoints
+    invalidate_checkpoints
+
+    If your implementation stores checkpoints and changes the text without
+    using apply_changes() (e.g. when a user edits the text), it should call
+    invalidate_checkpoints() with the position of the change.
 
     You may use the following attributes:
 
@@ -258,6 +266,46 @@ class DocumentBase(object):
                               for end, text in reversed(sorted(items,
                                                                key=lambda i: (i[0] is None, i[0])))]
         self._changes.clear()
+        if self._changes_list:
+            self.invalidate_checkpoints(self._changes_list[-1][0])
+
+    def checkpoints(self, name):
+        """Return the list of checkpoints stored under the name.
+
+        Tools that need to read the document from the start to know some
+        state at a certain position (like the pitch language) can store
+        (position, value) tuples in this list, sorted by position, where
+        position is the position of a block. An implementation that stores
+        checkpoints must remove those from the block where the document is
+        changed and further, see invalidate_checkpoints().
+
+        The default implementation returns None, meaning that nothing can be
+        stored, and tools read from the start of the document.
+
+        """
+        return None
+
+    def block_cache(self, block):
+        """Return a dictionary to store information about the block in.
+
+        Tools that compute something from the tokens of a block (and the
+        state at its start) can store the result here, so it is computed only
+        once. The dictionary is emptied when the tokens of the block change.
+
+        The default implementation returns None, meaning that nothing can be
+        stored.
+
+        """
+        return None
+
+    def invalidate_checkpoints(self, position=0):
+        """Remove stored checkpoints from the block at position and further.
+
+        This is called when the document is changed using apply_changes().
+        The default implementation does nothing.
+
+        """
+        pass
 
     def update_cursors(self):
         """Updates the position of the registered Cursor instances."""
@@ -344,6 +392,70 @@ class DocumentBase(object):
         """Remove the range of text."""
         self[key] = ""
 
+    def write_blocks(self, changes):
+        """Make many changes, with only one change per changed block.
+
+        The changes are (start, end, text) tuples in document order, that
+        may not overlap and may not extend beyond the block they start in.
+        For every block, the text from the start of its first change to the
+        end of its last change is replaced at once, which is faster than
+        storing all the changes separately. Cursors in between move to the
+        start or end of that range. The changes are applied at once, also
+        when not called inside the context of the document.
+
+        """
+        changes = list(changes)
+        i = 0
+        with self:
+            while i < len(changes):
+                block = self.block(changes[i][0])
+                end = self.position(block) + len(self.text(block))
+                pos = changes[i][0]
+                text = self.text(block)[pos - self.position(block):]
+                pieces = []
+                index = 0
+                while i < len(changes) and changes[i][0] <= end:
+                    start, stop, new = changes[i]
+                    pieces.append(text[index:start - pos])
+                    pieces.append(new)
+                    index = stop - pos
+                    i += 1
+                self[pos:pos + index] = ''.join(pieces)
+
+    def rewrite_blocks(self, blocks, rewrite):
+        """Replace the text of blocks with the text computed by rewrite.
+
+        rewrite is called with every block (in document order) and should
+        return the new text for the block, which may contain newlines, or
+        None if the block does not change. All blocks are read before the
+        document is changed, and the changes are applied at once.
+
+        Only the part of a block that actually differs is replaced, so
+        cursors before and after that part keep their position; cursors
+        inside it move to its start or end.
+
+        """
+        changes = []
+        for block in blocks:
+            text = rewrite(block)
+            if text is None:
+                continue
+            old = self.text(block)
+            if text == old:
+                continue
+            # find the part that differs
+            start, end = 0, min(len(old), len(text))
+            while start < end and old[start] == text[start]:
+                start += 1
+            end = 0
+            while end < min(len(old), len(text)) - start and old[-1 - end] == text[-1 - end]:
+                end += 1
+            pos = self.position(block)
+            changes.append((pos + start, pos + len(old) - end, text[start:len(text) - end]))
+        with self:
+            for start, end, text in changes:
+                self[start:end] = text
+
 
 class Document(DocumentBase):
     """A plain text LilyPond source document that auto-updates the tokens.
@@ -356,6 +468,7 @@ class Document(DocumentBase):
 
     def __init__(self, text='', mode=None):
         super(Document, self).__init__()
+        self._checkpoints = {}
         self._fridge = ly.lex.Fridge()
         self._mode = mode
         self._guessed_mode = None
@@ -424,10 +537,12 @@ class Document(DocumentBase):
         self.modified = False
 
     def _update_all_tokens(self):
+        self.invalidate_checkpoints()
         state = self.initial_state()
         for b in self._blocks:
             b.tokens = tuple(state.tokens(b.text))
             b.state = self._fridge.freeze(state)
+            b.cache = None
 
     def initial_state(self):
         """Return the state at the beginning of the document."""
@@ -470,6 +585,34 @@ class Document(DocumentBase):
         """Return the tuple of tokens of the specified block."""
         return block.tokens
 
+    def checkpoints(self, name):
+        """Return the list of checkpoints stored under the name.
+
+        The checkpoints are removed from the changed block and further when
+        the document is changed.
+
+        """
+        try:
+            return self._checkpoints[name]
+        except KeyError:
+            points = self._checkpoints[name] = []
+            return points
+
+    def invalidate_checkpoints(self, position=0):
+        """Remove stored checkpoints from the block at position and further."""
+        block = self.block(position)
+        if block is not None:
+            position = self.position(block)
+        for points in self._checkpoints.values():
+            del points[bisect.bisect_left(points, (position,)):]
+
+    def block_cache(self, block):
+        """Return a dictionary to store information about the block in."""
+        cache = block.cache
+        if cache is None:
+            cache = block.cache = {}
+        return cache
+
     def apply_changes(self):
         for start, end, text in self._changes_list:
             s = self.block(start)
@@ -515,6 +658,7 @@ class Document(DocumentBase):
         for block in self._blocks[s.index:]:
             if reparse or block.tokens is None:
                 block.tokens = tuple(state.tokens(block.text))
+                block.cache = None
                 frozen = self._fridge.freeze(state)
                 reparse = block.state != frozen
                 block.state = frozen
@@ -532,6 +676,7 @@ class _Block(object):
     position = sys.maxsize  # prevent picking those blocks before updating pos
     state = None
     tokens = None
+    cache = None
 
     def __init__(self, text="", index=-1):
         self.text = text
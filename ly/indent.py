@@ -23,6 +23,8 @@ Indent and auto-indent.
 
 from __future__ import unicode_literals
 
+import bisect
+
 import ly.lex.lilypond
 import ly.lex.scheme
 
@@ -32,6 +34,7 @@ class Indenter(object):
     # variables
     indent_tabs = False     # use tabs for indent
     indent_width = 2        # amount of spaces if indent_tabs == False
+    checkpoint_interval = 100   # lines between stored indent checkpoints
 
     def __init__(self):
         pass
@@ -43,48 +46,96 @@ class Indenter(object):
         larger if necessary. If False (the default), the indent of blank
         lines if not changed if it is shorter than it should be.
 
+        Only the lines from a stored checkpoint before the cursor's range are
+        read to know the indent there; checkpoints are stored in the document
+        every checkpoint_interval lines.
+
+        This method is built on indent_state(), indent_line() and
+        push_indents(), which ly.reformat.reformat() also uses to indent while
+        it reformats. Override those to change the indenting everywhere.
+
         """
-        indents = ['']
+        d = cursor.document
         start_block, end_block = cursor.start_block(), cursor.end_block()
-        in_range = False
-        pline = None
-        prev_indent = ''
-        with cursor.document as d:
-            for b in cursor.document:
-                if b == start_block:
-                    in_range = True
-
-                line = Line(d, b)
-
-                # handle indents of prev line
-                if pline:
-                    if pline.indent is not False:
-                        prev_indent = pline.indent
-                    if pline.indenters:
-                        current_indent = indents[-1]
-                        for align, indent in pline.indenters:
-                            new_indent = current_indent
-                            if align:
-                                new_indent += ' ' * (align - len(prev_indent))
-                            if indent:
-                                new_indent += '\t' if self.indent_tabs else ' ' * self.indent_width
-                            indents.append(new_indent)
-                del indents[max(1, len(indents) - line.dedenters_start):]
-
-                # if we may not change the indent just remember the current
-                if line.indent is not False:
-                    if not in_range:
-                        indents[-1] = line.indent
-                    elif not indent_blank_lines and line.isblank and indents[-1].startswith(line.indent):
-                        pass  # don't make shorter indents longer on blank lines
-                    elif line.indent != indents[-1]:
-                        d[d.position(b):d.position(b)+len(line.indent)] = indents[-1]
-                del indents[max(1, len(indents) - line.dedenters_end):]
-
+        indents, prev_indent = self.indent_state(d, start_block)
+        with d:
+            for b in d.blocks_forward(start_block):
+                line = get_line(d, b)
+                indent = self.indent_line(indents, line, indent_blank_lines)
+                if indent is not None:
+                    d[d.position(b):d.position(b)+len(line.indent)] = indent
                 if b == end_block:
                     break
+                prev_indent = self.push_indents(indents, line, prev_indent)
+
+    def indent_state(self, document, block):
+        """Return (indents, prev_indent) at the start of the block.
+
+        indents is the list of indent strings (the last one is the current
+        indent), and prev_indent the indent of the last indentable line.
+        The lines are read from the nearest stored checkpoint before the
+        block (if the document stores checkpoints), and new checkpoints are
+        stored along the way.
+
+        """
+        points = document.checkpoints(('indent', self.indent_tabs, self.indent_width))
+        i = bisect.bisect_left(points, (document.position(block) + 1,)) if points else 0
+        position, indents, prev_indent = points[i - 1] if i else (0, ('',), '')
+        indents = list(indents)
+        count = 0
+        for b in document.blocks_forward(document.block(position)):
+            if b == block:
+                break
+            if count == self.checkpoint_interval and points is not None:
+                count = 0
+                points.insert(i, (document.position(b), tuple(indents), prev_indent))
+                i += 1
+            count += 1
+            line = get_line(document, b)
+            self.indent_line(indents, line, None)
+            prev_indent = self.push_indents(indents, line, prev_indent)
+        return indents, prev_indent
+
+    def indent_line(self, indents, line, indent_blank_lines=False):
+        """Handle the dedenters of the line and return its new indent.
+
+        indents is the list returned by indent_state(), line a Line. Returns
+        None if the indent does not need to change. If indent_blank_lines is
+        None, the line is outside the range to indent and its current indent
+        is just remembered.
 
-                pline = line
+        """
+        del indents[max(1, len(indents) - line.dedenters_start):]
+        result = None
+        if line.indent is not False:
+            if indent_blank_lines is None:
+                indents[-1] = line.indent
+            elif not indent_blank_lines and line.isblank and indents[-1].startswith(line.indent):
+                pass  # don't make shorter indents longer on blank lines
+            elif line.indent != indents[-1]:
+                result = indents[-1]
+        del indents[max(1, len(indents) - line.dedenters_end):]
+        return result
+
+    def push_indents(self, indents, line, prev_indent):
+        """Add the indents the line starts for the next lines.
+
+        Call this after indent_line() for every line. Returns the new
+        prev_indent.
+
+        """
+        if line.indent is not False:
+            prev_indent = line.indent
+        if line.indenters:
+            current_indent = indents[-1]
+            for align, indent in line.indenters:
+                new_indent = current_indent
+                if align:
+                    new_indent += ' ' * (align - len(prev_indent))
+                if indent:
+                    new_indent += '\t' if self.indent_tabs else ' ' * self.indent_width
+                indents.append(new_indent)
+        return prev_indent
 
     def increase_indent(self, cursor):
         """Manually add indent to all lines of cursor."""
@@ -132,7 +183,7 @@ class Indenter(object):
         a multiline string.
 
         """
-        return Line(document, block).indent
+        return get_line(document, block).indent
 
     def compute_indent(self, document, block):
         """Return the indent the specified block should have.
@@ -149,14 +200,14 @@ class Indenter(object):
         indenting.
 
         """
-        line = Line(document, block)
+        line = get_line(document, block)
         if line.indent is False:
             return False
         depth = line.dedenters_start
         blocks = document.blocks_backward(document.previous_block(block))
         align, indent = None, False
         for b in blocks:
-            line = Line(document, b)
+            line = get_line(document, b)
             indents = len(line.indenters)
             if 0 <= depth < indents:
                 # we found the indent token
@@ -176,7 +227,7 @@ class Indenter(object):
         i = line.indent
         if i is False:
             for b in blocks:
-                i = Line(document, b).indent
+                i = get_line(document, b).indent
                 if i is not False:
                     break
             else:
@@ -188,12 +239,33 @@ class Indenter(object):
         return i
 
 
+def get_line(document, block):
+    """Return the Line for the block.
+
+    The Line is stored in the block_cache() of the document (if available)
+    and reused until the tokens of the block change.
+
+    """
+    cache = document.block_cache(block)
+    if cache is None:
+        return Line(document, block)
+    try:
+        return cache['ly.indent.Line']
+    except KeyError:
+        line = cache['ly.indent.Line'] = Line(document, block)
+        return line
+
+
 class Line(object):
     """Brings together all relevant information about a line (block)."""
 
-    def __init__(self, document, block):
+    def __init__(self, document, block, start=0, end=None):
         """Initialize with a block (line) of the document.
 
+        If start or end is given, only the tokens[start:end] of the block are
+        read, as if they were on a line of their own. This is used by
+        ly.reformat to indent lines before they are actually broken.
+
         After init, the following attributes are set:
 
         indent
@@ -233,18 +305,23 @@ class Line(object):
         should a new indent level be added (a tab or some amount of spaces).
 
         """
-        state = document.state(block)
         tokens = document.tokens(block)
+        offset = 0
+        if start or end is not None:
+            if start:
+                offset = tokens[start].pos
+            tokens = tokens[start:end]
+        parser = None if start else document.state(block).parser()
 
         # are we in a multi-line string?
-        if isinstance(state.parser(), (
+        if isinstance(parser, (
                 ly.lex.lilypond.ParseString,
                 ly.lex.scheme.ParseString,
                 )):
             self.indent = False
             self.isblank = False
         # or a multi-line comment?
-        elif isinstance(state.parser(), (
+        elif isinstance(parser, (
                 ly.lex.lilypond.ParseBlockComment,
                 ly.lex.scheme.ParseBlockComment,
                 )):
@@ -301,13 +378,13 @@ class Line(object):
             token, rest = indent[0], indent[1:]
             if isinstance(token, ly.lex.scheme.OpenParen):
                 if len(rest) > 1 and self.is_alignable_scheme_keyword(rest[0]):
-                    align, indent = rest[1].pos, False
+                    align, indent = rest[1].pos - offset, False
                 elif len(rest) == 1 and not isinstance(rest[0], ly.lex.Comment):
-                    align, indent = rest[0].pos, False
+                    align, indent = rest[0].pos - offset, False
                 else:
-                    align, indent = token.pos, True
+                    align, indent = token.pos - offset, True
             elif rest and not isinstance(rest[0], ly.lex.Comment):
-                align, indent = rest[0].pos, False
+                align, indent = rest[0].pos - offset, False
             else:
                 align, indent = None, True
             self.indenters.append((align, indent))
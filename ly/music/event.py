@@ -24,10 +24,18 @@ Translates a music.items.Document tree into lists of events.
 
 from __future__ import unicode_literals
 
+import bisect
+from fractions import Fraction
+
+import ly.pitch
+import ly.util
+from . import items
+
 
 class Events(object):
     """Traverses a music tree and records music events from it."""
     unfold_repeats = False
+    unit = 1    # the scaling that makes a whole note last 1
 
     def read(self, node, time=0, scaling=1):
         """Read events from the node and all its child nodes; return time."""
@@ -36,3 +44,465 @@ class Events(object):
     def traverse(self, node, time, scaling):
         """Traverse node and call event handlers; record and return the time."""
         return node.events(self, time, scaling)
+
+    def scale(self, scaling, factor):
+        """Return the scaling multiplied by factor (e.g. from Music.preceding())."""
+        return scaling * factor
+
+    def fraction(self, time):
+        """Return the time we computed as a (Fraction) value."""
+        return time
+
+    def from_fraction(self, value):
+        """Return the (Fraction) value as a time we compute with."""
+        return value
+
+
+class TickEvents(Events):
+    """Traverses a music tree like Events, computing with integer ticks.
+
+    Instantiate with the number of ticks a whole note lasts, the unit. All
+    times and scalings are integer numbers of ticks, which is much faster
+    than computing with Fractions. Use tick_resolution() to get a unit that
+    is suitable for a music tree. A ValueError is raised if a duration is
+    not an integer number of ticks.
+
+    """
+    def __init__(self, unit):
+        self.unit = unit
+        self._lengths = {}
+
+    def read(self, node, time=0, scaling=None):
+        """Read events from the node and all its child nodes; return time."""
+        return self.traverse(node, time, self.unit if scaling is None else scaling)
+
+    def traverse(self, node, time, scaling):
+        """Traverse node and call event handlers; record and return the time."""
+        if isinstance(node, items.Durable):
+            # cache the length of every duration tuple (often shared by
+            # many items) as integer numerator and denominator
+            duration = node.duration
+            try:
+                d, num, den = self._lengths[id(duration)]
+                if d is not duration:
+                    raise KeyError
+            except KeyError:
+                length = duration[0] * duration[1]
+                num, den = length.numerator, length.denominator
+                self._lengths[id(duration)] = duration, num, den
+            ticks, rest = divmod(num * scaling, den)
+            if rest:
+                raise ValueError("duration not on a tick boundary")
+            return time + ticks
+        elif isinstance(node, items.Scaler):
+            scaling = self.scale(scaling, node.scaling)
+        elif isinstance(node, items.Grace):
+            scaling = 0
+        else:
+            return node.events(self, time, scaling)
+        return items.Music.events(node, self, time, scaling)
+
+    def scale(self, scaling, factor):
+        """Return the scaling multiplied by factor (e.g. from Music.preceding())."""
+        factor = Fraction(factor)
+        scaling, rest = divmod(scaling * factor.numerator, factor.denominator)
+        if rest:
+            raise ValueError("scaling not on a tick boundary")
+        return scaling
+
+    def fraction(self, time):
+        """Return the time in ticks as a Fraction of whole notes."""
+        return Fraction(time, self.unit)
+
+    def from_fraction(self, value):
+        """Return the Fraction of whole notes in ticks."""
+        ticks = Fraction(value) * self.unit
+        if ticks.denominator != 1:
+            raise ValueError("value not on a tick boundary")
+        return ticks.numerator
+
+
+class _Resolution(Events):
+    """Computes the least common multiple of all denominators of lengths."""
+    def __init__(self):
+        self.resolution = 1
+        self._seen = set()
+        self._last = None
+
+    def traverse(self, node, time, scaling):
+        if isinstance(node, items.Durable):
+            # subsequent notes without duration share the same duration tuple
+            last = node.duration, scaling
+            if self._last is None or last[0] is not self._last[0] or last[1] is not self._last[1]:
+                self._last = last
+                base, s = node.duration
+                self._add(Fraction(base * s * scaling).denominator)
+            return time
+        elif isinstance(node, items.Scaler):
+            scaling *= node.scaling
+            self._add(Fraction(scaling).denominator)
+            return items.Music.events(node, self, time, scaling)
+        elif isinstance(node, items.UserCommand):
+            # read referenced music only once for every scaling
+            value = node.value()
+            if value is not None:
+                key = id(value), scaling
+                if key in self._seen:
+                    return time
+                self._seen.add(key)
+        return node.events(self, time, scaling)
+
+    def _add(self, denominator):
+        a, b = self.resolution, denominator
+        while b:
+            a, b = b, a % b
+        self.resolution = self.resolution // a * denominator
+
+
+def tick_resolution(node):
+    """Return the least number of ticks a whole note can be divided in.
+
+    All the music in the node (e.g. a Document, Score or Music node) is
+    traversed, and the least common multiple is computed of the
+    denominators of all the durations (as they are scaled by tuplets etc).
+    Use the value to instantiate a TickEvents object.
+
+    """
+    r = _Resolution()
+
+    def read(node):
+        if isinstance(node, (items.Music, items.Durable)):
+            r.read(node)
+        else:
+            for n in node:
+                read(n)
+    read(node)
+    return r.resolution
+
+
+class EventTable(Events, ly.util.ColumnTable):
+    r"""Traverses a music tree once and records all Durable items in a table.
+
+    The table is stored in columns, which are array.array instances of the
+    same length, one row for every note, rest, skip, lyric etc. A chord
+    yields a row for every note it contains.
+
+    onset       the time (as float) the item starts
+    duration    the length (as float) of the item, scaled
+    note        the note (0 to 6) of the pitch, -1 if the item has no pitch
+    alter       the alteration (float, e.g. -0.5 for a flat) of the pitch
+    octave      the octave of the pitch, made absolute inside \relative
+    position    the position of the item in the source document
+    context     index in the contexts list of the context path, a tuple of
+                (context, context_id) tuples of the enclosing \new and
+                \context commands
+    kind        index in the kinds list of the name of the Item class
+
+    Pitches are read as they are written, except for \relative music which
+    is made absolute. The start pitches of \relative and \transpose are not
+    recorded.
+
+    Use it like this::
+
+        t = EventTable()
+        t.read(node)    # e.g. a Document, Score or Music node
+        for row in t.rows():
+            ...
+
+    If NumPy is installed, the numpy() method returns the columns as NumPy
+    arrays, sharing the memory with the arrays.
+
+    """
+    columns = (
+        ('onset', 'd'),
+        ('duration', 'd'),
+        ('note', 'b'),
+        ('alter', 'd'),
+        ('octave', 'b'),
+        ('position', 'l'),
+        ('context', 'i'),
+        ('kind', 'i'),
+    )
+
+    def __init__(self, first_pitch_absolute=False):
+        """Initialize an empty table.
+
+        If first_pitch_absolute is True, the first pitch of a \relative
+        expression without start pitch is regarded as absolute, like
+        LilyPond >= 2.18 does. Otherwise it is relative to c'.
+
+        """
+        super(EventTable, self).__init__()
+        self.first_pitch_absolute = first_pitch_absolute
+        self.contexts = [()]
+        self.kinds = []
+        self._context_index = {(): 0}
+        self._kind_index = {}
+        self._path = ()
+        self._last_pitch = None     # not None inside \relative
+        self._last_chord = []
+
+    def read(self, node, time=0, scaling=1):
+        """Read events from the node and all its child nodes; return time.
+
+        If the node is not a music expression (e.g. a Document or Score),
+        all the music expressions inside it are read, each starting at time,
+        and the end time of the longest is returned. Assignments and \\header,
+        \\paper, \\layout and \\midi blocks are skipped.
+
+        """
+        if isinstance(node, (items.Music, items.Durable)):
+            return self.traverse(node, time, scaling)
+        end = time
+        for n in node:
+            if not isinstance(n, (items.Assignment, items.Header,
+                                  items.Paper, items.Layout, items.Midi)):
+                end = max(end, self.read(n, time, scaling))
+        return end
+
+    def traverse(self, node, time, scaling):
+        """Traverse node, recording Durable items; return the time."""
+        if isinstance(node, items.Durable):
+            end = node.events(self, time, scaling)
+            if node.duration is items.Durable.duration:
+                # a pitch argument, e.g. of \octaveCheck, not a real note
+                return end
+            if isinstance(node, items.Chord):
+                pitches = [(self.pitch(n), n.position) for n in node if isinstance(n, items.Note)]
+                if self._last_pitch and pitches:
+                    # the first pitch of a chord counts for the next note
+                    self._last_pitch = pitches[0][0]
+                self._last_chord = [p for p, pos in pitches]
+            elif isinstance(node, items.Note):
+                pitches = [(self.pitch(node), node.position)]
+            elif isinstance(node, items.Q):
+                pitches = [(p, node.position) for p in self._last_chord]
+            else:
+                pitches = [(None, node.position)]
+            for pitch, position in pitches or [(None, node.position)]:
+                self.record(node, time, end - time, pitch, position)
+            return end
+        elif isinstance(node, items.Context):
+            path = self._path
+            context = node.context()
+            self._path += ((context and context[:], node.context_id()),)
+            try:
+                return node.events(self, time, scaling)
+            finally:
+                self._path = path
+        elif isinstance(node, (items.Relative, items.Absolute, items.Transpose)):
+            children = node[:]
+            if isinstance(node, items.Transpose):
+                del children[:2]
+            last_pitch = self._last_pitch
+            if isinstance(node, items.Absolute):
+                self._last_pitch = None
+            elif isinstance(node, items.Relative):
+                if children and isinstance(children[0], items.Note):
+                    self._last_pitch = children.pop(0).pitch.copy()
+                elif self.first_pitch_absolute:
+                    self._last_pitch = ly.pitch.Pitch.f0()
+                else:
+                    self._last_pitch = ly.pitch.Pitch.c1()
+            try:
+                for n in children:
+                    time = self.traverse(n, time, scaling)
+            finally:
+                self._last_pitch = last_pitch
+            return time
+        return node.events(self, time, scaling)
+
+    def pitch(self, note):
+        """Return the pitch of the Note, made absolute when in \relative."""
+        p = note.pitch.copy()
+        if self._last_pitch:
+            if note.pitch.octavecheck is not None:
+                p.octave = note.pitch.octavecheck
+            else:
+                p.makeAbsolute(self._last_pitch)
+            self._last_pitch = p
+        return p
+
+    def record(self, node, time, length, pitch=None, position=None):
+        """Add a row for the node.
+
+        The pitch is a ly.pitch.Pitch or None, the position defaults to the
+        position of the node.
+
+        """
+        self.onset.append(float(time))
+        self.duration.append(float(length))
+        if pitch:
+            self.note.append(pitch.note)
+            self.alter.append(float(pitch.alter))
+            self.octave.append(pitch.octave)
+        else:
+            self.note.append(-1)
+            self.alter.append(0.0)
+            self.octave.append(0)
+        self.position.append(node.position if position is None else position)
+        try:
+            context = self._context_index[self._path]
+        except KeyError:
+            context = self._context_index[self._path] = len(self.contexts)
+            self.contexts.append(self._path)
+        self.context.append(context)
+        name = node.__class__.__name__
+        try:
+            kind = self._kind_index[name]
+        except KeyError:
+            kind = self._kind_index[name] = len(self.kinds)
+            self.kinds.append(name)
+        self.kind.append(kind)
+
+
+class MeasureIndex(Events):
+    r"""Maps measure numbers to musical time and positions in the source.
+
+    Instantiate with a music expression (e.g. a Music node); it is traversed
+    once. Then the following lookups use bisection:
+
+    measure(time)           the number of the measure the time is in
+    time(measure)           the time the measure starts
+    position(measure)       the position in the source where it starts
+    measure_at(position)    the number of the measure at the source position
+
+    The measures follow the \time, \partial, \cadenzaOn, \cadenzaOff and
+    \set Timing.measureLength commands. Repeats are counted as they are
+    printed (volta repeats once, with every alternative), unless
+    unfold_repeats is set to True. Measures are numbered from 1, but a pickup
+    measure created by \partial at the start has number 0.
+
+    The position of a measure is the position of the first note, rest etc.
+    that starts at its start time, or else that sounds at its start (e.g. a
+    multi-measure rest) or that starts later; -1 if there is none.
+
+    Use TickMeasureIndex to compute with integer ticks, which is faster.
+    Items.Document.measure_index() keeps an index for every toplevel music
+    expression.
+
+    """
+    def __init__(self, node):
+        self.first = 1          # the number of the first measure
+        self.times = []         # the start time (Fraction) of every measure
+        self.positions = []     # the source position of every measure
+        self._starts = [0]      # the start time of every measure
+        self._timing = []       # (time, command, value) tuples
+        self._items = []        # (time, end, position) of every Durable
+        self._end = self.read(node)
+        self.end = self.fraction(self._end)
+        self._build()
+
+    def __len__(self):
+        return len(self._starts)
+
+    def traverse(self, node, time, scaling):
+        """Traverse node, recording Durable items and timing commands."""
+        if isinstance(node, items.Durable):
+            end = super(MeasureIndex, self).traverse(node, time, scaling)
+            if node.duration is not items.Durable.duration:
+                self._items.append((time, end, node.position))
+            return end
+        elif isinstance(node, items.TimeSignature):
+            self._timing.append((time, 'length', node.measure_length()))
+        elif isinstance(node, items.Partial):
+            self._timing.append((time, 'partial', node.partial_length()))
+        elif isinstance(node, items.Set):
+            value = node.value()
+            if node.property() == 'measureLength' and isinstance(value, items.Scheme):
+                length = value.get_ly_make_moment()
+                if length:
+                    self._timing.append((time, 'length', length))
+        elif isinstance(node, items.Command):
+            if node.token in ('\\cadenzaOn', '\\cadenzaOff'):
+                self._timing.append((time, 'cadenza', node.token == '\\cadenzaOn'))
+        return super(MeasureIndex, self).traverse(node, time, scaling)
+
+    def _build(self):
+        """(Internal) Compute the measures from the recorded events."""
+        times = self._starts
+        length = self.from_fraction(1)  # the measure length
+        start = 0               # the (virtual) start of the current measure
+        cadenza = None          # the time the current cadenza started
+        for time, command, value in sorted(self._timing, key=lambda t: t[0]):
+            if cadenza is None:
+                while start + length <= time:
+                    start += length
+                    times.append(start)
+            if command == 'length':
+                length = self.from_fraction(value)
+            elif command == 'partial':
+                value = self.from_fraction(value)
+                if time == 0 and value < length:
+                    self.first = 0
+                start = time - length + value
+            elif value:
+                if cadenza is None:
+                    cadenza = time
+            elif cadenza is not None:
+                # the measure does not advance during the cadenza
+                start += time - cadenza
+                cadenza = None
+        self._next = None       # the start of the measure after the last
+        if cadenza is None:
+            while start + length < self._end:
+                start += length
+                times.append(start)
+            self._next = start + length
+        self.times = [self.fraction(t) for t in times]
+
+        self._items.sort(key=lambda i: i[0])
+        onsets = [i[0] for i in self._items]
+        for time in times:
+            i = bisect.bisect_left(onsets, time)
+            if i < len(onsets) and onsets[i] == time:
+                position = self._items[i][2]
+            elif i and self._items[i - 1][1] > time:
+                position = self._items[i - 1][2]
+            elif i < len(onsets):
+                position = self._items[i][2]
+            else:
+                position = -1
+            self.positions.append(position)
+        self._by_position = sorted((i[2], i[0]) for i in self._items)
+
+    def measure(self, time):
+        """Return the number of the measure the time (a Fraction) is in."""
+        return max(bisect.bisect_right(self.times, time) - 1, 0) + self.first
+
+    def time(self, measure):
+        """Return the time the measure starts; IndexError if it is not there."""
+        if measure < self.first:
+            raise IndexError("measure number out of range")
+        return self.times[measure - self.first]
+
+    def position(self, measure):
+        """Return the source position of the measure; IndexError if it is not there."""
+        if measure < self.first:
+            raise IndexError("measure number out of range")
+        return self.positions[measure - self.first]
+
+    def measure_at(self, position):
+        """Return the number of the measure of the note, rest etc. at or before position.
+
+        If music at that position is used more than once (e.g. in a variable),
+        the last time counts. Returns None if there is no music before the
+        position.
+
+        """
+        i = bisect.bisect_right(self._by_position, (position, self._end))
+        if i:
+            return self.measure(self.fraction(self._by_position[i - 1][1]))
+
+
+class TickMeasureIndex(MeasureIndex, TickEvents):
+    """A MeasureIndex that computes with integer ticks, see TickEvents.
+
+    Instantiate with the music expression and the number of ticks a whole
+    note lasts. A ValueError is raised if a duration or measure length is
+    not an integer number of ticks.
+
+    """
+    def __init__(self, node, unit):
+        TickEvents.__init__(self, unit)
+        MeasureIndex.__init__(self, node)
@@ -42,7 +42,11 @@ to construct those items.
 
 from __future__ import unicode_literals
 
+import bisect
+import collections
 from fractions import Fraction
+import itertools
+import os
 import re
 
 import ly.node
@@ -67,6 +71,7 @@ class Item(ly.node.WeakNode):
     tokens = ()
     token = None
     position = -1
+    _end_position = None
 
     def __repr__(self):
         s = ' ' + repr(self.token[:]) if self.token else ''
@@ -82,24 +87,65 @@ class Item(ly.node.WeakNode):
         return ""
 
     def end_position(self):
-        """Return the end position of this node."""
-        def ends():
-            if self.tokens:
-                yield self.tokens[-1].end
-            elif self.token:
-                yield self.token.end
-            else:
-                yield self.position
-            if len(self):
-                # end pos of the last child
-                yield self[-1].end_position()
-            # end pos of Item or Token instances in attributes, such as duration etc
-            for i in vars(self).values():
-                if isinstance(i, Item):
+        """Return the end position of this node.
+
+        The value is computed once and then cached. Changing the children
+        of a node invalidates the cached value of the node and its ancestors,
+        but if you change other attributes (such as tokens) after calling
+        this method, you should call invalidate_end_position() yourself.
+
+        """
+        end = self._end_position
+        if end is None:
+            end = self._end_position = max(self._ends())
+        return end
+
+    def _ends(self):
+        """(Internal) Yield the end positions of our tokens and child nodes."""
+        if self.tokens:
+            yield self.tokens[-1].end
+        elif self.token:
+            yield self.token.end
+        else:
+            yield self.position
+        if len(self):
+            # end pos of the last child
+            yield self[-1].end_position()
+        # end pos of Item or Token instances in attributes, such as duration etc
+        # (but not an included Document or the Include node of a Document)
+        for i in vars(self).values():
+            if isinstance(i, Item):
+                if not isinstance(i, Document) and not isinstance(self, Document):
                     yield i.end_position()
-                elif isinstance(i, lex.Token):
-                    yield i.end
-        return max(ends())
+            elif isinstance(i, lex.Token):
+                yield i.end
+
+    def invalidate_end_position(self):
+        """Forget the cached end position of this node and its ancestors."""
+        node = self
+        while node is not None and node._end_position is not None:
+            node._end_position = None
+            node = node.parent()
+
+    def _set_parent(self, node):
+        """(Internal) Set the Node (or None) as our parent."""
+        # our old and new parent get a different end position
+        old = self.parent()
+        if old is not None:
+            old.invalidate_end_position()
+        if node is not None:
+            node.invalidate_end_position()
+        super(Item, self)._set_parent(node)
+
+    def unlink(self):
+        """Remove all children and unlink() them as well."""
+        super(Item, self).unlink()
+        self.invalidate_end_position()
+
+    def sort(self, key=None, reverse=False):
+        """Sorts the children, optionally using the key function."""
+        super(Item, self).sort(key, reverse)
+        self.invalidate_end_position()
 
     def events(self, e, time, scaling):
         """Let the event.Events instance handle the events. Return the time."""
@@ -152,6 +198,42 @@ class Item(ly.node.WeakNode):
                     yield i
         return follow(self.iter_toplevel_items())
 
+    def find_definition(self, name, markup=False):
+        """Return the toplevel node defining name, as seen from this node.
+
+        This finds the same Assignment as searching iter_toplevel_items_include()
+        would, but uses the symbol table of the Document(s), so it is fast.
+
+        If markup is True, a toplevel Scheme expression defining a markup
+        command with that name (using define-markup-command) is also returned.
+        Returns None if no definition is found.
+
+        """
+        node = self
+        for doc in self.ancestors():
+            if isinstance(doc, Document):
+                break
+            node = doc
+        else:
+            return
+        kinds = ('assignment', 'markup') if markup else ('assignment',)
+        position = node.position
+        while True:
+            found = None
+            for kind in kinds:
+                d = doc.definition(kind, name, position)
+                if d and (not found or d[0] > found[0]):
+                    found = d
+            if found:
+                return found[1]
+            # look in parent Document before the place we were included
+            if not doc.include_node:
+                return
+            p = doc.include_node.parent()
+            if not isinstance(p, Document):
+                return
+            doc, position = p, doc.include_node.position
+
     def music_parent(self):
         """Walk up the parent tree until Music is found; return the outermost Music node.
 
@@ -217,6 +299,12 @@ class Item(ly.node.WeakNode):
 class Document(Item):
     """A toplevel item representing a ly.document.Document."""
 
+    # set to True to compute time_position() and time_length() using integer ticks
+    ticks = False
+
+    # True for an included Document that is shared by all Include nodes
+    _shared = False
+
     def __init__(self, doc):
         super(Document, self).__init__()
         self.document = doc
@@ -307,15 +395,15 @@ class Document(Item):
         """
         events = self.music_events_til_position(position)
         if events:
-            from . import event
-            e = event.Events()
-            time = 0
-            scaling = 1
-            for parent, nodes, s in events:
-                scaling *= s
-                for n in nodes:
-                    time = e.traverse(n, time, scaling)
-            return time
+            def time_position(e):
+                time = 0
+                scaling = e.unit
+                for parent, nodes, s in events:
+                    scaling = e.scale(scaling, s)
+                    for n in nodes:
+                        time = e.traverse(n, time, scaling)
+                return e.fraction(time)
+            return self._compute_time(time_position)
 
     def time_length(self, start, end):
         """Return the length of the music between start and end positions.
@@ -323,16 +411,36 @@ class Document(Item):
         Returns None if start and end are not in the same expression.
 
         """
-        def mk_list(evts):
+        def mk_list(e, evts):
             """Make a flat list of all the events."""
             lis = []
-            scaling = 1
+            scaling = e.unit
             for p, nodes, s in evts:
-                scaling *= s
+                scaling = e.scale(scaling, s)
                 for n in nodes:
                     lis.append((n, scaling))
             return lis
 
+        def time_length(e):
+            start_list = mk_list(e, start_evts)
+            end_list = mk_list(e, end_evts)
+            time = 0
+            i = 0
+            # traverse the common events only once
+            for i, ((evt, s), (end_evt, end_s)) in enumerate(zip(start_list, end_list)):
+                if evt is end_evt:
+                    time = e.traverse(evt, time, s)
+                else:
+                    break
+            end_time = time
+            # handle the remaining events for the start position
+            for evt, s in start_list[i::]:
+                time = e.traverse(evt, time, s)
+            # handle the remaining events for the end position
+            for evt, s in end_list[i::]:
+                end_time = e.traverse(evt, end_time, s)
+            return e.fraction(end_time - time)
+
         if start > end:
             start, end = end, start
 
@@ -341,26 +449,70 @@ class Document(Item):
             end_evts = self.music_events_til_position(end)
             if end_evts and start_evts[0][0] is end_evts[0][0]:
                 # yes, we have the same toplevel expression.
-                start_evts = mk_list(start_evts)
-                end_evts = mk_list(end_evts)
+                return self._compute_time(time_length)
+
+    def measure_index(self, position):
+        """Return an event.MeasureIndex for the music at the specified position.
+
+        The index is made for the outermost music expression at the position
+        (or the value of the assignment), when first needed, and then kept
+        on that node. If the ticks attribute is True, an
+        event.TickMeasureIndex is used. Returns None if we are not in a
+        music expression.
+
+        """
+        events = self.music_events_til_position(position)
+        if events:
+            node = events[0][0]
+            if isinstance(node, Assignment):
+                node = node.value()
+            elif not isinstance(node, Music):
+                # the Document, Score etc. the music is in
+                node = events[1][0] if len(events) > 1 else events[0][1][-1]
+            try:
+                return node._measure_index
+            except AttributeError:
                 from . import event
-                e = event.Events()
-                time = 0
-                i = 0
-                # traverse the common events only once
-                for i, ((evt, s), (end_evt, end_s)) in enumerate(zip(start_evts, end_evts)):
-                    if evt is end_evt:
-                        time = e.traverse(evt, time, s)
-                    else:
-                        break
-                end_time = time
-                # handle the remaining events for the start position
-                for evt, s in start_evts[i::]:
-                    time = e.traverse(evt, time, s)
-                # handle the remaining events for the end position
-                for evt, s in end_evts[i::]:
-                    end_time = e.traverse(evt, end_time, s)
-                return end_time - time
+                index = None
+                if self.ticks:
+                    try:
+                        index = event.TickMeasureIndex(node, self.tick_resolution())
+                    except ValueError:
+                        pass    # fall back to Fractions
+                if index is None:
+                    index = event.MeasureIndex(node)
+                node._measure_index = index
+                return index
+
+    def tick_resolution(self):
+        """Return the number of ticks a whole note is divided in.
+
+        This is the least common multiple of the denominators of all the
+        (scaled) durations in this document, see event.tick_resolution().
+        It is computed once, when first needed.
+
+        """
+        try:
+            return self._tick_resolution
+        except AttributeError:
+            from . import event
+            self._tick_resolution = event.tick_resolution(self)
+            return self._tick_resolution
+
+    def _compute_time(self, func):
+        """(Internal) Call func with an event.Events instance and return the result.
+
+        If the ticks attribute is True, an event.TickEvents instance is used
+        first, computing with integers instead of Fractions.
+
+        """
+        from . import event
+        if self.ticks:
+            try:
+                return func(event.TickEvents(self.tick_resolution()))
+            except ValueError:
+                pass    # fall back to Fractions
+        return func(event.Events())
 
     def substitute_for_node(self, node):
         """Returns a node that replaces the specified node (e.g. in music).
@@ -389,6 +541,74 @@ class Document(Item):
             for n in self.iter_music(n):
                 yield n
 
+    def definition(self, kind, name, position=None):
+        r"""Return a two-tuple (key, node) for the last definition of name.
+
+        kind is 'assignment' (for Assignment nodes) or 'markup' (for toplevel
+        Scheme expressions using define-markup-command). Only definitions
+        (including those in \include files) that start before position are
+        considered; if position is None the whole document is searched.
+
+        The key can be used to compare the order of definitions of different
+        kinds. Returns None if there is no definition.
+
+        The symbol table is built on first use.
+
+        """
+        try:
+            table = self._definitions
+        except AttributeError:
+            table = self._build_definitions()
+        try:
+            keys, nodes = table[kind, name]
+        except KeyError:
+            return
+        if position is None:
+            i = len(keys)
+        else:
+            i = bisect.bisect_left(keys, (position,))
+        if i:
+            return keys[i - 1], nodes[i - 1]
+
+    def _build_definitions(self):
+        r"""(Internal) Build and return the symbol table used by definition().
+
+        The table maps (kind, name) to two lists: the sorted keys and the
+        defining nodes. A key is a tuple (position, count), where position is
+        the position of the toplevel node, and count the definition order,
+        because an \include node adds all names defined in the included
+        document at its own position.
+
+        """
+        # set the table first, this prevents endless recursion with circular includes
+        table = self._definitions = {}
+        counter = itertools.count()
+
+        def add(position, kind, name, node):
+            keys, nodes = table.setdefault((kind, name), ([], []))
+            keys.append((position, next(counter)))
+            nodes.append(node)
+
+        for n in self:
+            if isinstance(n, Assignment):
+                add(n.position, 'assignment', n.name(), n)
+            elif isinstance(n, Scheme):
+                name = n.markup_command_name()
+                if name:
+                    add(n.position, 'markup', name, n)
+            elif isinstance(n, Include):
+                doc = self.get_included_document_node(n)
+                if doc:
+                    try:
+                        included = doc._definitions
+                    except AttributeError:
+                        included = doc._build_definitions()
+                    # the last definition of every name, in definition order
+                    for d in sorted((keys[-1], kind, name, nodes[-1])
+                                    for (kind, name), (keys, nodes) in included.items()):
+                        add(n.position, d[1], d[2], d[3])
+        return table
+
     def get_included_document_node(self, node):
         """Return a Document for the Include node. May return None."""
         try:
@@ -400,14 +620,14 @@ class Document(Item):
                 resolved = self.resolve_filename(filename)
                 if resolved:
                     docnode = self.get_music(resolved)
-                    docnode.include_node = node
-                    docnode.include_path = self.include_path
+                    if not docnode._shared:
+                        docnode.include_node = node
+                        docnode.include_path = self.include_path
                     node._document = docnode
             return node._document
 
     def resolve_filename(self, filename):
         """Resolve filename against our document and include_path."""
-        import os
         if os.path.isabs(filename):
             return filename
         path = list(self.include_path)
@@ -430,9 +650,85 @@ class Document(Item):
         encoding. Inherit from this class to implement other loading
         mechanisms or caching.
 
+        The loaded ly.document.Document (with its tokens) is kept in a
+        process-wide cache, so that a file that is included by many documents
+        is read and tokenized only once, as long as it is not modified on
+        disk. See clear_include_cache().
+
+        If the music Document does not depend on the document including it
+        (see is_self_contained()), it is cached as well and shared by all
+        the Include nodes referring to the file. A shared Document has no
+        include_node. Otherwise a new music Document is returned every time,
+        because it gets its own include_node and include_path.
+
         """
-        import ly.document
-        return type(self)(ly.document.Document.load(filename))
+        filename = os.path.abspath(filename)
+        try:
+            st = os.stat(filename)
+        except OSError:
+            stamp = None
+        else:
+            stamp = (st.st_mtime, st.st_size)
+        try:
+            cached_stamp, doc, music = _include_cache.pop(filename)
+        except KeyError:
+            doc = music = None
+        else:
+            if stamp is None or cached_stamp != stamp:
+                doc = music = None
+        if doc is None:
+            import ly.document
+            doc = ly.document.Document.load(filename)
+        result = music
+        if music is None or type(music) is not type(self):
+            result = type(self)(doc)
+            if result.is_self_contained():
+                result._shared = True
+                music = result
+        if stamp is not None and include_cache_size > 0:
+            _include_cache[filename] = stamp, doc, music
+            while len(_include_cache) > include_cache_size:
+                _include_cache.popitem(last=False)
+        return result
+
+    def is_self_contained(self):
+        r"""Return True if nothing in this document depends on an including document.
+
+        This is the case if there are no \include commands, and all user
+        commands refer to definitions in this document itself.
+
+        """
+        for n in self:
+            for node in itertools.chain((n,), n.descendants()):
+                if isinstance(node, Include):
+                    return False
+                elif isinstance(node, UserCommand):
+                    if not self.definition('assignment', node.name(), n.position):
+                        return False
+                elif isinstance(node, MarkupUserCommand):
+                    if not (self.definition('assignment', node.name(), n.position)
+                            or self.definition('markup', node.name(), n.position)):
+                        return False
+        return True
+
+
+# the process-wide cache of loaded included files, used by Document.get_music()
+include_cache_size = 32
+_include_cache = collections.OrderedDict()
+
+
+def clear_include_cache(filename=None):
+    """Remove loaded included files from the cache used by Document.get_music().
+
+    If filename is given, only that file is removed, otherwise the cache is
+    emptied. Include nodes that already were resolved keep their Document.
+
+    """
+    if filename is None:
+        _include_cache.clear()
+    else:
+        filename = os.path.abspath(filename)
+        _include_cache.pop(filename, None)
 
 
 class Token(Item):
@@ -952,9 +1248,9 @@ class UserCommand(Music):
 
     def value(self):
         """Find the value assigned to this variable."""
-        for i in self.iter_toplevel_items_include():
-            if isinstance(i, Assignment) and i.name() == self.name():
-                return i.value()
+        assignment = self.find_definition(self.name())
+        if assignment:
+            return assignment.value()
 
     def events(self, e, time, scaling):
         """Let the event.Events instance handle the events. Return the time."""
@@ -1033,23 +1329,10 @@ class MarkupUserCommand(Item):
 
     def value(self):
         """Find the value assigned to this variable."""
-        for i in self.iter_toplevel_items_include():
-            if isinstance(i, Assignment) and i.name() == self.name():
-                return i.value()
-            elif isinstance(i, Scheme):
-                for j in i:
-                    if isinstance(j, SchemeList):
-                        for k in j:
-                            if isinstance(k, SchemeItem) and k.token == 'define-markup-command':
-                                for l in j[1::]:
-                                    if isinstance(l, SchemeList):
-                                        for m in l:
-                                            if isinstance(m, SchemeItem) and m.token == self.name():
-                                                return i
-                                            break
-                                    break
-                            break
-                    break
+        node = self.find_definition(self.name(), True)
+        if isinstance(node, Assignment):
+            return node.value()
+        return node
 
 
 class MarkupScore(Item):
@@ -1269,6 +1552,30 @@ class Scheme(Item):
         if len(tokens) == 3 and tokens[0] == 'ly:make-moment':
             if tokens[1].isdigit() and tokens[2].isdigit():
                 return Fraction(int(tokens[1]), int(tokens[2]))
+        elif len(tokens) == 2 and tokens[0] == 'ly:make-moment':
+            if isinstance(tokens[1], scheme.Fraction):
+                return Fraction(tokens[1])
+
+    def markup_command_name(self):
+        """Return the name if this expression defines a markup command.
+
+        Recognizes ``#(define-markup-command (name layout props ...) ...)``
+        and returns None if this is something else.
+
+        """
+        for j in self:
+            if isinstance(j, SchemeList):
+                for k in j:
+                    if isinstance(k, SchemeItem) and k.token == 'define-markup-command':
+                        for l in j[1::]:
+                            if isinstance(l, SchemeList):
+                                for m in l:
+                                    if isinstance(m, SchemeItem):
+                                        return m.token
+                                    break
+                            break
+                    break
+            break
 
     def get_bool(self):
         """A basic way to get a boolean."""
@@ -24,8 +24,10 @@ Pitch manipulation.
 from __future__ import unicode_literals
 
 import re
+import bisect
 from fractions import Fraction
 
+import ly.document
 import ly.lex.lilypond
 
 
@@ -89,7 +91,16 @@ class Pitch(object):
 
     Attributes may be manipulated directly.
 
+    Only the attributes listed in __slots__ can be set. The *_token attributes
+    are set by PitchIterator.pitches() and refer to the tokens the pitch was
+    read from; the transposed attribute is used by ly.pitch.transpose.
+
     """
+    __slots__ = (
+        'note', 'alter', 'octave', 'accidental', 'octavecheck',
+        'note_token', 'octave_token', 'accidental_token', 'octavecheck_token',
+        'transposed',
+    )
 
     def __init__(self, note=0, alter=0, octave=0, accidental="", octavecheck=None):
         self.note = note                # base note (c, d, e, f, g, a, b)
@@ -148,6 +159,13 @@ class PitchWriter(object):
         self.names = names
         self.accs = accs
         self.replacements = replacements
+        # memo of (note, alter) -> name, None if no name is available
+        self._names = {}
+        for note in range(len(names)):
+            for i, acc in enumerate(accs):
+                alter = Fraction(i - 4, 4)
+                if acc or not alter:
+                    self._names[(note, alter)] = self._write(note, alter)
 
     def __call__(self, note, alter=0):
         """
@@ -155,6 +173,20 @@ class PitchWriter(object):
         Raises PitchNameNotAvailable if the requested pitch
         has an alteration that is not available in the current language.
         """
+        try:
+            pitch = self._names[(note, alter)]
+        except KeyError:
+            try:
+                pitch = self._write(note, alter)
+            except PitchNameNotAvailable:
+                pitch = None
+            self._names[(note, alter)] = pitch
+        if pitch is None:
+            raise PitchNameNotAvailable(self.language)
+        return pitch
+
+    def _write(self, note, alter):
+        """Compute the name for the pitch; called by __call__ on a memo miss."""
         pitch = self.names[note]
         if alter:
             acc = self.accs[int(alter * 4 + 4)]
@@ -175,8 +207,32 @@ class PitchReader(object):
         self.replacements = replacements
         self.rx = re.compile("({0})({1})?$".format("|".join(names),
                                                    "|".join(acc for acc in accs if acc)))
+        # memo of name -> (note, alter), False for names that are not a pitch;
+        # pre-populated with all names a PitchWriter would produce
+        self._pitches = {}
+        writer = PitchWriter(names, accs, replacements)
+        for name in writer._names.values():
+            if name is not None:
+                self._pitches[name] = self._read(name)
 
     def __call__(self, text):
+        try:
+            return self._pitches[text]
+        except KeyError:
+            result = self._pitches[text[:]] = self._read(text)
+            return result
+
+    def known_names(self):
+        """Return a list of the names read so far.
+
+        These are at least all the names a PitchWriter for the same language
+        writes. Names that were read but are not a pitch are included too.
+
+        """
+        return list(self._pitches)
+
+    def _read(self, text):
+        """Parse the name; called by __call__ on a memo miss."""
         for s, r in self.replacements:
             if text.startswith(r):
                 text = s + text[len(r):]
@@ -235,6 +291,53 @@ def pitchWriter(language):
         return res
 
 
+def checkpoint(document, position, language="nederlands"):
+    """Return (position, language) to start reading pitches from.
+
+    The returned position is the start of a block at or before the specified
+    position, where the LilyPond parser is at the toplevel and no music
+    expression is pending, so that reading pitches from there gives the same
+    results as reading from the start of the document. The returned language
+    is the pitch language in effect there, given the language at the start
+    of the document.
+
+    The checkpoints are stored in the document, so a subsequent call only
+    needs to read the text after the last checkpoint before position. If the
+    document does not store checkpoints, (0, language) is returned.
+
+    """
+    points = document.checkpoints(('pitch', language))
+    if points is None:
+        return 0, language
+    i = bisect.bisect_left(points, (position + 1,))
+    start, lang = points[i - 1] if i else (0, language)
+    end = document.position(document.block(position))
+    if start < end:
+        initial = document.initial_state()
+        depth, parser = initial.depth(), type(initial.parser())
+
+        def add(block):
+            """Add a checkpoint if the parser is at the toplevel in block."""
+            state = document.state(block)
+            if state.depth() == depth and type(state.parser()) is parser:
+                points.insert(i, (document.position(block), pitches.language))
+                return 1
+            return 0
+
+        source = ly.document.Source(ly.document.Cursor(document, start, end))
+        pitches = PitchIterator(source, lang)
+        block = source.block
+        last = None
+        for t in pitches.tokens():
+            if source.block != block:
+                block = source.block
+                if isinstance(last, (ly.lex.MatchEnd, ly.lex.StringEnd)):
+                    i += add(block)
+            if not isinstance(t, (ly.lex.Space, ly.lex.Comment)):
+                last = t
+    return points[i - 1] if i else (0, language)
+
+
 class PitchIterator(object):
     """Iterate over notes or pitches in a source."""
 
@@ -333,35 +436,75 @@ class PitchIterator(object):
         with a ly.document.Source that has tokens_with_position set to True.
 
         """
-        document = self.source.document
         pwriter = pitchWriter(language or self.language)
+        changes = []
         note = pwriter(pitch.note, pitch.alter)
         end = pitch.note_token.end
         if note != pitch.note_token:
-            document[pitch.note_token.pos:end] = note
+            changes.append((pitch.note_token.pos, end, note))
         octave = octaveToString(pitch.octave)
         if octave != pitch.octave_token:
             if pitch.octave_token is None:
-                document[end:end] = octave
+                changes.append((end, end, octave))
             else:
                 end = pitch.octave_token.end
-                document[pitch.octave_token.pos:end] = octave
+                changes.append((pitch.octave_token.pos, end, octave))
         if pitch.accidental:
             if pitch.accidental_token is None:
-                document[end:end] = pitch.accidental
+                changes.append((end, end, pitch.accidental))
             elif pitch.accidental != pitch.accidental_token:
                 end = pitch.accidental_token.end
-                document[pitch.accidental_token.pos:end] = pitch.accidental
+                changes.append((pitch.accidental_token.pos, end, pitch.accidental))
         elif pitch.accidental_token:
-            del document[pitch.accidental_token.pos:pitch.accidental_token.end]
+            changes.append((pitch.accidental_token.pos, pitch.accidental_token.end, ""))
         if pitch.octavecheck is not None:
             octavecheck = '=' + octaveToString(pitch.octavecheck)
             if pitch.octavecheck_token is None:
-                document[end:end] = octavecheck
+                changes.append((end, end, octavecheck))
             elif octavecheck != pitch.octavecheck_token:
-                document[pitch.octavecheck_token.pos:pitch.octavecheck_token.end] = octavecheck
+                changes.append((pitch.octavecheck_token.pos, pitch.octavecheck_token.end, octavecheck))
         elif pitch.octavecheck_token:
-            del document[pitch.octavecheck_token.pos:pitch.octavecheck_token.end]
+            changes.append((pitch.octavecheck_token.pos, pitch.octavecheck_token.end, ""))
+        if len(changes) == 1:
+            start, end, text = changes[0]
+            self.source.document[start:end] = text
+        elif changes:
+            self._write_changes(pitch, changes)
+
+    def _write_changes(self, pitch, changes):
+        """Write the changes to the tokens of a pitch as a single replacement.
+
+        The changes are (start, end, text) tuples, applied in the same way the
+        document would apply them. If the tokens are not adjacent, the changes
+        are written separately.
+
+        """
+        document = self.source.document
+        tokens = sorted((t for t in (pitch.note_token, pitch.octave_token,
+                                     pitch.accidental_token, pitch.octavecheck_token)
+                         if t is not None), key=lambda t: t.pos)
+        pos = tokens[0].pos
+        for t, n in zip(tokens, tokens[1:]):
+            if t.end != n.pos:
+                for start, end, text in changes:
+                    document[start:end] = text
+                return
+        old = new = ''.join(tokens)
+        # last start first; for the same start, last end and last change first
+        for i, (start, end, text) in sorted(enumerate(changes),
+                                            key=lambda c: (c[1][0], c[1][1], c[0]),
+                                            reverse=True):
+            new = new[:start - pos] + text + new[end - pos:]
+        if new != old:
+            # strip the unchanged beginning and end
+            size = min(len(old), len(new))
+            i = 0
+            while i < size and old[i] == new[i]:
+                i += 1
+            j = 0
+            while j < size - i and old[-1 - j] == new[-1 - j]:
+                j += 1
+            document[pos + i:pos + len(old) - j] = new[i:len(new) - j]
 
 
 class LanguageName(ly.lex.Token):
@@ -48,11 +48,22 @@ def abs2rel(cursor, language="nederlands", startpitch=True, first_pitch_absolute
 
     """
     start = cursor.start
-    cursor.start = 0
+    cursor.start, language = ly.pitch.checkpoint(cursor.document, start, language)
 
     source = ly.document.Source(cursor, True, tokens_with_position=True)
 
     pitches = ly.pitch.PitchIterator(source, language)
+    _abs2rel(pitches, start, startpitch, first_pitch_absolute)
+
+
+def _abs2rel(pitches, start, startpitch, first_pitch_absolute):
+    """Implementation of abs2rel(), reading from a PitchIterator.
+
+    The PitchIterator must read from a Source with state and tokens with
+    position. Pitches before the start position are not changed.
+
+    """
+    source = pitches.source
     psource = pitches.pitches()
 
     if start > 0:
@@ -128,7 +139,7 @@ def abs2rel(cursor, language="nederlands", startpitch=True, first_pitch_absolute
             consume()
 
     # Do it!
-    with cursor.document as document:
+    with source.document as document:
         for t in tsource:
             if t in ('{', '<<'):
                 # Ok, parse current expression.
@@ -0,0 +1,148 @@
+# This file is part of python-ly, https://pypi.python.org/pypi/python-ly
+#
+# Copyright (c) 2008 - 2015 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Extract the pitches of music in compact arrays, for analysis.
+
+Example::
+
+    import ly.document
+    import ly.pitch.extract
+
+    t = ly.pitch.extract.extract(ly.document.Cursor(doc))
+    lowest = min(zip(t.octave, t.note))     # ambitus, ignoring alterations
+
+"""
+
+from __future__ import unicode_literals
+
+import ly.document
+import ly.lex.lilypond
+import ly.pitch
+import ly.pitch.rel2abs
+import ly.util
+
+
+def extract(cursor, language="nederlands", first_pitch_absolute=False):
+    r"""Return a PitchTable with the pitches in the cursor's range.
+
+    language: language to start reading pitch names in
+
+    first_pitch_absolute: if True, the first pitch of a \relative expression
+        is regarded as absolute when no starting pitch was given (LilyPond
+        >= 2.18 behaviour), otherwise it is relative to c'.
+
+    Octaves are made absolute inside \relative music in the same way as
+    ly.pitch.rel2abs does, also if the \relative expression starts before
+    the cursor's range. The document is not changed.
+
+    """
+    start, language = ly.pitch.checkpoint(cursor.document, cursor.start, language)
+    source = _Source(ly.document.Cursor(cursor.document, start, cursor.end),
+                     True, tokens_with_position=True)
+    pitches = _PitchIterator(source, language)
+    ly.pitch.rel2abs._rel2abs(pitches, 0, first_pitch_absolute)
+    table = PitchTable()
+    for p in pitches.recorded:
+        pos = p.note_token.pos
+        if pos >= cursor.start:
+            table.note.append(p.note)
+            table.alter.append(p.alter)
+            table.octave.append(p.octave)
+            table.position.append(pos)
+    return table
+
+
+class PitchTable(ly.util.ColumnTable):
+    r"""The pitches of a piece of music, stored in columns.
+
+    The columns are array.array instances of the same length, with one row
+    for every pitch, in the order of the text:
+
+    note        the note (0 to 6) of the pitch
+    alter       the alteration (float, e.g. -0.5 for a flat) of the pitch
+    octave      the octave of the pitch, made absolute inside \relative
+    position    the position of the note name in the document
+
+    The pitches of commands like \relative, \transpose, \key and
+    \octaveCheck are not recorded, and a chord repetition (q) has no rows,
+    because it has no pitch names. Use extract() to get a PitchTable.
+
+    If NumPy is installed, the numpy() method returns the columns as NumPy
+    arrays, sharing the memory with the arrays.
+
+    """
+    columns = (
+        ('note', 'b'),
+        ('alter', 'd'),
+        ('octave', 'b'),
+        ('position', 'l'),
+    )
+
+
+class _Source(ly.document.Source):
+    """A Source whose document property returns a document that ignores
+    all changes, so the rel2abs walker can be used to read pitches."""
+    @property
+    def document(self):
+        return _NullDocument()
+
+
+class _NullDocument(object):
+    """Can be changed like a Document, but ignores the changes."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __setitem__(self, key, text):
+        pass
+
+    def __delitem__(self, key):
+        pass
+
+
+class _PitchIterator(ly.pitch.PitchIterator):
+    """A PitchIterator that records the pitches it yields, except those of
+    pitch commands, and does not write them.
+
+    The rel2abs walker makes the recorded pitches absolute in place.
+
+    """
+    def __init__(self, source, language="nederlands"):
+        super(_PitchIterator, self).__init__(source, language)
+        self.recorded = []
+
+    def pitches(self):
+        args = 0    # pitch arguments of a pitch command that are to come
+        for t in super(_PitchIterator, self).pitches():
+            if isinstance(t, ly.pitch.Pitch):
+                if args:
+                    args -= 1
+                else:
+                    self.recorded.append(t)
+            elif isinstance(t, ly.lex.lilypond.PitchCommand):
+                args = 2 if t == '\\transpose' else 1
+            elif not isinstance(t, (ly.lex.Space, ly.lex.Comment)):
+                args = 0
+            yield t
+
+    def write(self, pitch, language=None):
+        pass
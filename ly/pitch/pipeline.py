@@ -0,0 +1,174 @@
+# This file is part of python-ly, https://pypi.python.org/pypi/python-ly
+#
+# Copyright (c) 2008 - 2015 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Apply a chain of pitch manipulations.
+
+Consecutive transpositions and translations are combined and performed in one
+pass over the tokens, with one edit batch.
+"""
+
+from __future__ import unicode_literals
+
+import ly.document
+import ly.pitch
+import ly.pitch.translate
+import ly.pitch.transpose
+
+
+def pipeline(cursor, steps, language="nederlands", relative_first_pitch_absolute=False):
+    r"""Apply the pitch manipulations in steps to the cursor's range.
+
+    Every step can be:
+
+    * a transposer, i.e. an object with a transpose(pitch) method, like the
+      Transposer, Simplifier, ModeShifter and ModalTransposer classes in
+      ly.pitch.transpose,
+    * a language name from ly.pitch.pitchInfo, to translate the pitch names
+      to that language,
+    * any other callable, which is called with a Cursor and the current pitch
+      language, e.g. ly.pitch.rel2abs.rel2abs (use functools.partial to
+      give other arguments).
+
+    The result is the same as calling the respective functions one after
+    another, but consecutive transposers and language names are applied
+    together in a single pass, with one edit batch. After a translation, the
+    following steps read the pitch names in the new language. (So if a
+    translation is not the last step, the document should use the same
+    language everywhere, or the cursor should include the language commands,
+    to get the same result as the separate functions.)
+
+    relative_first_pitch_absolute is used for the transposers, see
+    ly.pitch.transpose.transpose().
+
+    May raise ly.pitch.PitchNameNotAvailable, in which case the pass that
+    raised it did not change the document.
+
+    Returns True if a translation encountered a \language or \include
+    language command, like ly.pitch.translate.translate() does.
+
+    """
+    changed = False
+    group = []
+    for step in list(steps) + [None]:
+        if step is not None and (hasattr(step, 'transpose') or step in ly.pitch.pitchInfo):
+            group.append(step)
+            continue
+        if group:
+            changed = _combined(cursor, group, language,
+                                relative_first_pitch_absolute) or changed
+            for s in group:
+                if s in ly.pitch.pitchInfo:
+                    language = s
+            group = []
+        if step is not None:
+            step(ly.document.Cursor(cursor.document, cursor.start, cursor.end), language)
+    return changed
+
+
+def _combined(cursor, steps, language, relative_first_pitch_absolute):
+    """Apply consecutive transposers and translations in one pass."""
+    document = cursor.document
+    start = cursor.start
+    if not any(hasattr(s, 'transpose') for s in steps):
+        c = ly.document.Cursor(document, start, cursor.end)
+        return ly.pitch.translate.translate(c, steps[-1], language)
+    c = ly.document.Cursor(document, start, cursor.end)
+    c.start, language = ly.pitch.checkpoint(document, start, language)
+    source = ly.document.Source(c, True, tokens_with_position=True)
+    pitches = _PitchIterator(source, language, steps, start)
+    with document:
+        ly.pitch.transpose._transpose(pitches, pitches, start, relative_first_pitch_absolute)
+        return pitches.translate()
+
+
+class _PitchIterator(ly.pitch.PitchIterator):
+    """A PitchIterator that also is the transposer for the combined steps.
+
+    Pitches are written in the language of the last translation step (if any),
+    and translate() translates the pitches that were not written.
+
+    """
+    def __init__(self, source, language, steps, start):
+        super(_PitchIterator, self).__init__(source, language)
+        self.steps = steps
+        self.start = start
+        self.target = None
+        for s in steps:
+            if s in ly.pitch.pitchInfo:
+                self.target = s
+        self._pitches = []      # (pitch, note, alter) as read, to translate
+        self._languages = []    # LanguageName tokens to translate
+        self._written = set()
+        self._checks = {}
+
+    def tokens(self):
+        for t in super(_PitchIterator, self).tokens():
+            if (self.target and isinstance(t, ly.pitch.LanguageName)
+                    and t.pos >= self.start):
+                self._languages.append(t)
+            yield t
+
+    def pitches(self):
+        for p in super(_PitchIterator, self).pitches():
+            if (self.target and isinstance(p, ly.pitch.Pitch)
+                    and p.note_token.pos >= self.start):
+                self._pitches.append((p, p.note, p.alter))
+            yield p
+
+    def transpose(self, pitch):
+        """Apply all the steps, remembering the names that need to exist."""
+        checks = []
+        language = None     # the current language of the document
+        for s in self.steps:
+            if s in ly.pitch.pitchInfo:
+                language = s
+            else:
+                s.transpose(pitch)
+                checks.append((language, pitch.note, pitch.alter))
+        self._checks[id(pitch)] = pitch, checks
+
+    def write(self, pitch, language=None):
+        p, checks = self._checks.pop(id(pitch), (None, ()))
+        if p is pitch:
+            for lang, note, alter in checks:
+                # a separate transposition would write the pitch name here
+                ly.pitch.pitchWriter(lang or self.language)(note, alter)
+        self._written.add(id(pitch))
+        super(_PitchIterator, self).write(pitch, language or self.target)
+
+    def translate(self):
+        """Translate the pitches that were not written and the language names.
+
+        Returns True if there were language names, like
+        ly.pitch.translate.translate().
+
+        """
+        if self.target:
+            document = self.source.document
+            writer = ly.pitch.pitchWriter(self.target)
+            for p, note, alter in self._pitches:
+                if id(p) not in self._written:
+                    n = writer(note, alter)
+                    if n != p.note_token:
+                        document[p.note_token.pos:p.note_token.end] = n
+            for t in self._languages:
+                if t != self.target:
+                    document[t.pos:t.end] = self.target
+        return bool(self._languages)
@@ -43,11 +43,22 @@ def rel2abs(cursor, language="nederlands", first_pitch_absolute=False):
 
     """
     start = cursor.start
-    cursor.start = 0
+    cursor.start, language = ly.pitch.checkpoint(cursor.document, start, language)
 
     source = ly.document.Source(cursor, True, tokens_with_position=True)
 
     pitches = ly.pitch.PitchIterator(source, language)
+    _rel2abs(pitches, start, first_pitch_absolute)
+
+
+def _rel2abs(pitches, start, first_pitch_absolute):
+    """Implementation of rel2abs(), reading from a PitchIterator.
+
+    The PitchIterator must read from a Source with state and tokens with
+    position. Pitches before the start position are not changed.
+
+    """
+    source = pitches.source
     psource = pitches.pitches()
 
     if start > 0:
@@ -170,6 +181,6 @@ def rel2abs(cursor, language="nederlands", first_pitch_absolute=False):
             makeAbsolute(t, lastPitch)
 
     # Do it!
-    with cursor.document as document:
+    with source.document as document:
         for t in tsource:
             pass
@@ -0,0 +1,247 @@
+# This file is part of python-ly, https://pypi.python.org/pypi/python-ly
+#
+# Copyright (c) 2008 - 2015 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Pitch manipulations from text to text, without using a Document.
+
+These functions read lines of LilyPond text, e.g. from a file object, and write
+the changed text to an output stream as soon as it can not change anymore.
+This is much faster than loading the text in a ly.document.Document, and the
+memory usage stays limited, which is useful when converting many or large
+files.
+
+Example:
+
+.. code-block:: python
+
+    import sys
+    import ly.pitch.stream
+
+    with open('music.ly') as f:
+        ly.pitch.stream.rel2abs(f, sys.stdout)
+
+"""
+
+from __future__ import unicode_literals
+
+import ly.lex
+import ly.pitch
+import ly.pitch.abs2rel
+import ly.pitch.rel2abs
+import ly.pitch.translate
+import ly.pitch.transpose
+
+
+def rel2abs(lines, output, language="nederlands", first_pitch_absolute=False, mode="lilypond"):
+    """Read lines of text, write them to output with relative music made absolute.
+
+    See ly.pitch.rel2abs.rel2abs() for the arguments.
+
+    """
+    with Stream(lines, output, mode) as stream:
+        pitches = ly.pitch.PitchIterator(stream, language)
+        ly.pitch.rel2abs._rel2abs(pitches, 0, first_pitch_absolute)
+
+
+def abs2rel(lines, output, language="nederlands", startpitch=True, first_pitch_absolute=False,
+            mode="lilypond"):
+    """Read lines of text, write them to output with absolute music made relative.
+
+    See ly.pitch.abs2rel.abs2rel() for the arguments.
+
+    """
+    with Stream(lines, output, mode) as stream:
+        pitches = ly.pitch.PitchIterator(stream, language)
+        ly.pitch.abs2rel._abs2rel(pitches, 0, startpitch, first_pitch_absolute)
+
+
+def transpose(lines, output, transposer, language="nederlands",
+              relative_first_pitch_absolute=False, mode="lilypond"):
+    """Read lines of text, write them to output with the music transposed.
+
+    See ly.pitch.transpose.transpose() for the arguments.
+
+    """
+    with Stream(lines, output, mode) as stream:
+        pitches = ly.pitch.PitchIterator(stream, language)
+        ly.pitch.transpose._transpose(pitches, transposer, 0, relative_first_pitch_absolute)
+
+
+def translate(lines, output, language, default_language="nederlands", mode="lilypond"):
+    r"""Read lines of text, write them to output with the pitch names translated.
+
+    Returns True if there was a \language or \include language command.
+    See ly.pitch.translate.translate() for the arguments.
+
+    """
+    with Stream(lines, output, mode) as stream:
+        pitches = ly.pitch.PitchIterator(stream, default_language)
+        return ly.pitch.translate._translate(pitches, pitches.tokens(), language)
+
+
+class Stream(object):
+    """Reads and tokenizes lines of text and writes them with changes applied.
+
+    A Stream can be read by a ly.pitch.PitchIterator like a ly.document.Source
+    with state and tokens with position, and it can be changed like a
+    Document, using the document attribute, which returns the Stream itself.
+
+    Text is written to the output at the start of a line where the lexer is at
+    the toplevel and the previous token closed a construct (like the
+    checkpoints of ly.pitch.checkpoint()), up to the previous such line. So a
+    change may be made anywhere in the current toplevel expression.
+
+    When used as a context manager, the remaining tokens are read and all
+    text is written on exit.
+
+    """
+    def __init__(self, lines, output, mode="lilypond"):
+        self.output = output
+        self.state = ly.lex.state(mode)
+        self._buffer = []       # the lines not yet written
+        self._buffer_pos = 0    # the position of the first line in the buffer
+        self._changes = []      # (start, end, count, text) tuples
+        self._gen = self._tokens(lines)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._gen)
+
+    next = __next__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            for t in self:
+                pass
+            self._write(None)
+
+    @property
+    def document(self):
+        """Return ourselves, so we can be changed as a Document."""
+        return self
+
+    def position(self, token):
+        """Return the position of the token."""
+        return token.pos
+
+    def __setitem__(self, key, text):
+        """Change the text pointed to in key (integer or slice)."""
+        if isinstance(key, slice):
+            start = key.start or 0
+            end = key.stop
+            if start > end:
+                start, end = end, start
+        else:
+            start = key
+            end = start + 1
+        if start < self._buffer_pos:
+            raise RuntimeError("text at {0} has already been written".format(start))
+        text = text.replace('\r', '')
+        if text or start != end:
+            self._changes.append((start, end, len(self._changes), text))
+
+    def __delitem__(self, key):
+        """Remove the range of text."""
+        self[key] = ""
+
+    def _tokens(self, lines):
+        """Yield the tokens with their position, and a Newline between lines.
+
+        Writes the text when a line is reached where that is safe.
+
+        """
+        depth, parser = self.state.depth(), type(self.state.parser())
+        pos = 0
+        last = None     # last token that was not space or comment
+        safe = 0        # position of the last line where we could have written
+        for line in _blocks(lines):
+            if pos:
+                if (isinstance(last, (ly.lex.MatchEnd, ly.lex.StringEnd))
+                        and self.state.depth() == depth
+                        and type(self.state.parser()) is parser):
+                    self._write(safe)
+                    safe = pos
+                yield ly.lex.Newline('\n', pos - 1)
+            self._buffer.append(line)
+            for t in self.state.tokens(line):
+                t.pos += pos
+                t.end += pos
+                if not isinstance(t, (ly.lex.Space, ly.lex.Comment)):
+                    last = t
+                yield t
+            pos += len(line) + 1
+
+    def _write(self, position):
+        """Apply the changes and write the text before position to the output.
+
+        The position must be the start of a buffered line, or None to write
+        everything.
+
+        """
+        if position is None:
+            count = len(self._buffer)
+        else:
+            count = 0
+            pos = self._buffer_pos
+            while pos < position:
+                pos += len(self._buffer[count]) + 1
+                count += 1
+        if not count:
+            return
+        text = '\n'.join(self._buffer[:count])
+        if position is not None:
+            text += '\n'
+        start = self._buffer_pos
+        end = start + len(text)
+        if position is not None and any(c[0] < end < c[1] for c in self._changes):
+            return  # a change crosses the end, try again later
+        del self._buffer[:count]
+        self._buffer_pos = end
+        changes, self._changes = self._changes, []
+        pieces = []
+        index = 0
+        for c in sorted(changes):
+            if c[0] >= end:
+                self._changes.append(c)
+                continue
+            pieces.append(text[index:c[0] - start])
+            pieces.append(c[3])
+            index = max(index, c[1] - start)
+        pieces.append(text[index:])
+        self.output.write(''.join(pieces))
+
+
+def _blocks(lines):
+    """Yield the lines without newline, like the blocks of a Document.
+
+    The lines may also be pieces of text of any length.
+
+    """
+    rest = ''
+    for text in lines:
+        parts = (rest + text).split('\n')
+        rest = parts.pop()
+        for line in parts:
+            yield line.replace('\r', '')
+    yield rest.replace('\r', '')
@@ -23,49 +23,81 @@ Transforming music by pitch manipulation.
 
 from __future__ import unicode_literals
 
+import array
+from fractions import Fraction
+
+import ly.document
 import ly.lex.lilypond
+import ly.pitch
 
 
 def retrograde(cursor, language="nederlands"):
     """Reverses pitches."""
-    source = ly.document.Source(cursor, True, tokens_with_position=True)
-
-    pitches = ly.pitch.PitchIterator(source, language)
-    psource = pitches.pitches()
-
-    plist = [p for p in psource if isinstance(p, ly.pitch.Pitch)]
-    rlist = [r.copy() for r in reversed(plist)]
+    # read the pitches in compact arrays
+    notes = array.array('b')
+    alters = array.array('b')   # in quarter tones
+    octaves = array.array('b')
+    for p in _pitches(cursor, language).pitches():
+        if isinstance(p, ly.pitch.Pitch):
+            notes.append(p.note)
+            alters.append(int(p.alter * 4))
+            octaves.append(p.octave)
 
-    with cursor.document as d:
-        for p, r in zip(plist, rlist):
-            p.note = r.note
-            p.alter = r.alter
-            p.octave = r.octave
-            pitches.write(p)
+    # read them again, writing them in reverse order
+    pitches = _pitches(cursor, language)
+    i = len(notes)
+    with cursor.document:
+        for p in pitches.pitches():
+            if isinstance(p, ly.pitch.Pitch):
+                i -= 1
+                p.note = notes[i]
+                p.alter = Fraction(alters[i], 4)
+                p.octave = octaves[i]
+                pitches.write(p)
 
 
 def inversion(cursor, language="nederlands"):
     """Inversion of the intervals between pitches."""
-    import ly.pitch.transpose
+    pitches = _pitches(cursor, language)
+    prev = None     # (note, alter, octave) of the previous pitch, as read
+    with cursor.document:
+        for p in pitches.pitches():
+            if isinstance(p, ly.pitch.Pitch):
+                if prev is None:
+                    prev = refp = p.note, p.alter, p.octave
+                    continue
+                # invert the interval from the previous to this pitch
+                note, alter, octave = _inversion(p.note, p.alter, prev[0], prev[1],
+                                                 refp[0], refp[1])
+                octave += refp[2] + prev[2] - p.octave
+                prev = p.note, p.alter, p.octave
+                p.note, p.alter, p.octave = refp = note, alter, octave
+                pitches.write(p)
+
 
+def _pitches(cursor, language):
+    """Return a PitchIterator for the cursor's range."""
     source = ly.document.Source(cursor, True, tokens_with_position=True)
+    return ly.pitch.PitchIterator(source, language)
 
-    pitches = ly.pitch.PitchIterator(source, language)
-    psource = pitches.pitches()
 
-    prev_note = None
+_inversions = {}
 
-    with cursor.document as d:
-        for p in psource:
-            if isinstance(p, ly.pitch.Pitch):
-                if prev_note is None:
-                    prev_note = refp = p
-                    continue
-                transposer = ly.pitch.transpose.Transposer(p, prev_note)
-                prev_note = p.copy()
-                p.note = refp.note
-                p.alter = refp.alter
-                p.octave = refp.octave
-                transposer.transpose(p)
-                refp = p
-                pitches.write(p)
+
+def _inversion(note, alter, prev_note, prev_alter, ref_note, ref_alter):
+    """Return (note, alter, octave) of the reference pitch, transposed by the
+    interval from the pitch to the previous pitch, all in octave 0.
+
+    Every result is computed only once.
+
+    """
+    key = note, alter, prev_note, prev_alter, ref_note, ref_alter
+    try:
+        return _inversions[key]
+    except KeyError:
+        import ly.pitch.transpose
+        p = ly.pitch.Pitch(ref_note, ref_alter)
+        ly.pitch.transpose.Transposer(
+            ly.pitch.Pitch(note, alter), ly.pitch.Pitch(prev_note, prev_alter))._transpose(p)
+        result = _inversions[key] = p.note, p.alter, p.octave
+        return result
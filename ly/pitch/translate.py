@@ -27,7 +27,7 @@ import ly.document
 import ly.pitch
 
 
-def translate(cursor, language, default_language="nederlands"):
+def translate(cursor, language, default_language="nederlands", bulk=False):
     r"""Changes the language of the pitch names.
 
     May raise ly.pitch.PitchNameNotAvailable if the current pitch language
@@ -39,39 +39,112 @@ def translate(cursor, language, default_language="nederlands"):
     should be added to the document. Or you could call insert_language to
     add a language command to the top of the document.
 
+    If bulk is True, the pitch names in every block are replaced at once,
+    instead of every pitch name separately, using the write_blocks() method
+    of the document. This is faster when many names change, but other
+    cursors between changed names move.
+
     """
     start = cursor.start
-    cursor.start = 0
+    cursor.start, default_language = ly.pitch.checkpoint(
+        cursor.document, start, default_language)
 
     source = ly.document.Source(cursor, tokens_with_position=True)
 
     pitches = ly.pitch.PitchIterator(source, default_language)
     tokens = pitches.tokens()
-    writer = ly.pitch.pitchWriter(language)
 
     if start > 0:
         # consume tokens before the selection, following the language
         source.consume(tokens, start)
         cursor.start = start
 
+    return _translate(pitches, tokens, language, bulk)
+
+
+def _translate(pitches, tokens, language, bulk=False):
+    """Implementation of translate(), reading tokens from the PitchIterator.
+
+    The PitchIterator must read from a Source with tokens with position.
+    If bulk is True, the Source must read from a Document.
+
+    """
+    changes = []    # (start, end, text) tuples, in bulk mode
     changed = False  # track change of \language or \include language command
-    with cursor.document as d:
+    table = translation(pitches.language, language)
+    with pitches.source.document as d:
         for t in tokens:
             if isinstance(t, ly.lex.lilypond.Note):
                 # translate the pitch name
-                p = pitches.read(t)
-                if p:
-                    n = writer(*p)
-                    if n != t:
-                        d[t.pos:t.end] = n
+                if table.source != pitches.language:
+                    table = translation(pitches.language, language)
+                n = table[t]
+                if n is None:
+                    raise ly.pitch.PitchNameNotAvailable(language)
+                if not n or n == t:
+                    continue
             elif isinstance(t, ly.pitch.LanguageName):
-                if t != language:
-                    # change the language name in a command
-                    d[t.pos:t.end] = language
                 changed = True
+                if t == language:
+                    continue
+                # change the language name in a command
+                n = language
+            else:
+                continue
+            if bulk:
+                changes.append((t.pos, t.end, n))
+            else:
+                d[t.pos:t.end] = n
+        if changes:
+            d.write_blocks(changes)
     return changed
 
 
+class Translation(dict):
+    """Maps the pitch names of one language to those of another language.
+
+    Looking up a name returns the name in the target language, None if the
+    pitch is not available in the target language, or False if the name is
+    not a pitch name in the source language. Every name is computed only
+    once; the regular names are computed on instantiation.
+
+    Use translation() to get a shared instance.
+
+    """
+    def __init__(self, source, target):
+        super(Translation, self).__init__()
+        self.source = source
+        self.target = target
+        self._reader = ly.pitch.pitchReader(source)
+        self._writer = ly.pitch.pitchWriter(target)
+        for name in self._reader.known_names():
+            self[name]
+
+    def __missing__(self, name):
+        pitch = self._reader(name)
+        if pitch:
+            try:
+                result = self._writer(*pitch)
+            except ly.pitch.PitchNameNotAvailable:
+                result = None
+        else:
+            result = False
+        self[name[:]] = result
+        return result
+
+
+_translations = {}
+
+
+def translation(source, target):
+    """Returns a Translation from the source to the target language."""
+    try:
+        return _translations[(source, target)]
+    except KeyError:
+        res = _translations[(source, target)] = Translation(source, target)
+        return res
+
+
 def insert_language(document, language, version=None):
     r"""Inserts a language command in the document.
 
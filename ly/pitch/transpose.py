@@ -23,9 +23,13 @@ Transposing music.
 
 from __future__ import unicode_literals
 
+import io
 from fractions import Fraction
 
+import ly.document
+import ly.lex
 import ly.lex.lilypond
+import ly.pitch
 
 
 class Transposer(object):
@@ -35,8 +39,13 @@ class Transposer(object):
     The scale is a list with the pitch height of the unaltered step (0 .. 6).
     The default scale is the normal scale: C, D, E, F, G, A, B.
 
+    The result for every note and alteration is computed once and then
+    looked up in a table, so the attributes should not be changed after
+    the first call to transpose().
+
     """
     scale = (0, 1, 2, Fraction(5, 2), Fraction(7, 2), Fraction(9, 2), Fraction(11, 2))
+    _table = None
 
     def __init__(self, fromPitch, toPitch, scale=None):
         if scale is not None:
@@ -53,6 +62,23 @@ class Transposer(object):
                       - self.scale[fromPitch.note] - fromPitch.alter)
 
     def transpose(self, pitch):
+        """Transpose the pitch, using the table."""
+        table = self._table
+        if table is None:
+            table = self._table = {}
+        key = pitch.note, pitch.alter
+        try:
+            note, alter, octave = table[key]
+        except KeyError:
+            p = ly.pitch.Pitch(*key)
+            self._transpose(p)
+            note, alter, octave = table[key] = p.note, p.alter, p.octave
+        pitch.note = note
+        pitch.alter = alter
+        pitch.octave += octave
+
+    def _transpose(self, pitch):
+        """Really transpose the pitch; called by transpose() on a table miss."""
         doct, note = divmod(pitch.note + self.steps, 7)
         pitch.alter += self.alter - doct * 6 - self.scale[note] + self.scale[pitch.note]
         pitch.octave += self.octave + doct
@@ -79,7 +105,7 @@ class Simplifier(Transposer):
         if scale is not None:
             self.scale = scale
 
-    def transpose(self, pitch):
+    def _transpose(self, pitch):
         if pitch.alter == 1:
             doct, note = divmod(pitch.note + 1, 7)
             pitch.alter -= doct * 6 + self.scale[note] - self.scale[pitch.note]
@@ -127,7 +153,7 @@ class ModeShifter(Transposer):
             p = key.copy()
             self.steps = s
             self.alter = a
-            super(ModeShifter, self).transpose(p)
+            Transposer._transpose(self, p)
             if self.modpitches[p.note]:
                 self.modpitches[p.note].append(p)
             else:
@@ -169,7 +195,7 @@ class ModeShifter(Transposer):
             dwnpitch = getNextPitch(step, False)[-1]
             return comparePitch(pitch, uppitch, dwnpitch)
 
-    def transpose(self, pitch):
+    def _transpose(self, pitch):
         """
         Shift to closest scale pitch if not already in scale.
         """
@@ -188,7 +214,7 @@ class ModeShifter(Transposer):
             self.octave = 0
         self.alter = (self.scale[clp.note] + clp.alter
                       - self.scale[pitch.note] - pitch.alter)
-        super(ModeShifter, self).transpose(pitch)
+        Transposer._transpose(self, pitch)
 
 
 class ModalTransposer(object):
@@ -252,11 +278,22 @@ def transpose(cursor, transposer, language="nederlands", relative_first_pitch_ab
 
     """
     start = cursor.start
-    cursor.start = 0
+    cursor.start, language = ly.pitch.checkpoint(cursor.document, start, language)
 
     source = ly.document.Source(cursor, True, tokens_with_position=True)
 
     pitches = ly.pitch.PitchIterator(source, language)
+    _transpose(pitches, transposer, start, relative_first_pitch_absolute)
+
+
+def _transpose(pitches, transposer, start, relative_first_pitch_absolute):
+    """Implementation of transpose(), reading from a PitchIterator.
+
+    The PitchIterator must read from a Source with state and tokens with
+    position. Pitches before the start position are not written.
+
+    """
+    source = pitches.source
     psource = pitches.pitches()
 
     class gen(object):
@@ -430,5 +467,182 @@ def transpose(cursor, transposer, language="nederlands", relative_first_pitch_ab
             transposeRelative(t, lastPitch)
 
     # Do it!
-    with cursor.document as document:
+    with source.document:
         absolute(tsource)
+
+
+class TransposeAnalysis(object):
+    """Reads a LilyPond text once, to transpose it with many transposers.
+
+    The text is tokenized and its pitches are read only once. For every
+    transposer the transposed text is then created from the recorded tokens
+    and pitches, without tokenizing the text again. This is useful to create
+    parts for transposing instruments from one concert pitch source::
+
+        analysis = TransposeAnalysis(text)
+        for transposer in transposers:
+            write_part(analysis.transpose(transposer))
+
+    """
+    def __init__(self, text, language="nederlands", mode=None):
+        """Read the text; language is the language to start reading pitch
+        names in, and mode the mode to tokenize the text in (guessed if None).
+
+        """
+        import ly.pitch.stream  # not at the top, it imports this module
+        if mode is None:
+            mode = ly.lex.guessMode(text)
+        self.language = language
+        output = io.StringIO()
+        source = ly.pitch.stream.Stream((text,), output, mode)
+        pitches = ly.pitch.PitchIterator(source, language)
+        state = source.state
+        with source:
+            # the lexer state and pitch language, as the walker sees them
+            self._items = [(t, state.depth(), state.parser(), pitches.language)
+                           for t in pitches.pitches()]
+        self.text = output.getvalue()
+
+    def transpose(self, transposer, relative_first_pitch_absolute=False):
+        """Return the text, transposed using the transposer.
+
+        The result is the same as that of transpose() on a Document with the
+        full text, see there for relative_first_pitch_absolute.
+
+        """
+        replay = _Replay(self._items)
+        pitches = _ReplayPitchIterator(replay, self.language)
+        _transpose(pitches, transposer, 0, relative_first_pitch_absolute)
+        return replay.apply(self.text)
+
+
+def transpose_text(text, transposers, language="nederlands",
+                   relative_first_pitch_absolute=False, mode=None, processes=None):
+    """Return a list with the text transposed using each of the transposers.
+
+    The text is read only once, using a TransposeAnalysis. If processes is
+    greater than 1, the transposed texts are created in parallel by that many
+    worker processes, each reading the text once. The transposers then must
+    be picklable, which the Transposers in this module are.
+
+    """
+    transposers = list(transposers)
+    if processes is None or processes < 2 or len(transposers) < 2:
+        analysis = TransposeAnalysis(text, language, mode)
+        return [analysis.transpose(t, relative_first_pitch_absolute)
+                for t in transposers]
+    import multiprocessing
+    pool = multiprocessing.Pool(min(processes, len(transposers)),
+                                _init_worker, (text, language, mode))
+    try:
+        return pool.map(_transpose_worker,
+                        [(t, relative_first_pitch_absolute) for t in transposers], 1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+_worker_analysis = None
+
+
+def _init_worker(text, language, mode):
+    """Read the text once in a worker process of transpose_text()."""
+    global _worker_analysis
+    _worker_analysis = TransposeAnalysis(text, language, mode)
+
+
+def _transpose_worker(args):
+    """Transpose the text of the worker process of transpose_text()."""
+    transposer, relative_first_pitch_absolute = args
+    return _worker_analysis.transpose(transposer, relative_first_pitch_absolute)
+
+
+class _Replay(object):
+    """Replays the tokens and pitches recorded by a TransposeAnalysis.
+
+    Can be read by a _ReplayPitchIterator like a ly.document.Source with
+    state, and can be changed like a Document. It also acts as the state and
+    the document itself. The changes are applied to the text by apply().
+
+    """
+    def __init__(self, items):
+        self.items = items
+        self._depth = 0
+        self._parser = None
+        self._changes = []  # (start, end, count, text) tuples
+
+    @property
+    def state(self):
+        return self
+
+    @property
+    def document(self):
+        return self
+
+    def depth(self):
+        return self._depth
+
+    def parser(self):
+        return self._parser
+
+    def position(self, token):
+        return token.pos
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __setitem__(self, key, text):
+        """Change the text pointed to in key (integer or slice)."""
+        if isinstance(key, slice):
+            start = key.start or 0
+            end = key.stop
+            if start > end:
+                start, end = end, start
+        else:
+            start = key
+            end = start + 1
+        text = text.replace('\r', '')
+        if text or start != end:
+            self._changes.append((start, end, len(self._changes), text))
+
+    def __delitem__(self, key):
+        """Remove the range of text."""
+        self[key] = ""
+
+    def apply(self, text):
+        """Return the text with the changes applied, like a Document would."""
+        pieces = []
+        index = 0
+        for start, end, count, t in sorted(self._changes):
+            pieces.append(text[index:start])
+            pieces.append(t)
+            index = max(index, end)
+        pieces.append(text[index:])
+        return ''.join(pieces)
+
+
+class _ReplayPitchIterator(ly.pitch.PitchIterator):
+    """A PitchIterator yielding the tokens and pitches of a _Replay.
+
+    Every Pitch is yielded as a new copy, as the pitches are changed when
+    transposing.
+
+    """
+    def pitches(self):
+        replay = self.source
+        Pitch = ly.pitch.Pitch
+        for t, depth, parser, language in replay.items:
+            replay._depth = depth
+            replay._parser = parser
+            self.language = language
+            if isinstance(t, Pitch):
+                p = Pitch(t.note, t.alter, t.octave, t.accidental, t.octavecheck)
+                p.note_token = t.note_token
+                p.octave_token = t.octave_token
+                p.accidental_token = t.accidental_token
+                p.octavecheck_token = t.octavecheck_token
+                t = p
+            yield t
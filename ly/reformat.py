@@ -45,63 +45,223 @@ def break_indenters(cursor):
     document, as it will look garbled with the added newlines.
 
     """
-    with cursor.document as d:
-        for b in cursor.blocks():
-            denters = []
-            tokens = d.tokens(b)
-            nonspace_index = -1
-            for i, t in enumerate(tokens):
-                if isinstance(t, ly.lex.Indent) and t in ('{', '<<'):
-                    denters.append(i)
-                elif isinstance(t, ly.lex.Dedent) and t in ('}', '>>'):
-                    if denters:
-                        denters.pop()
-                    elif nonspace_index != -1:
-                        # add newline before t
-                        pos = d.position(b) + t.pos
-                        d[pos:pos] = '\n'
-                if not isinstance(t, ly.lex.Space):
-                    nonspace_index = i
-            for i in denters:
-                if i < nonspace_index:
-                    # add newline after tokens[i]
-                    pos = d.position(b) + tokens[i].end
-                    d[pos:pos] = '\n'
+    d = cursor.document
+
+    def rewrite(block):
+        breaks = _breaks(d.tokens(block))
+        if breaks:
+            text = d.text(block)
+            bounds = [0] + [pos for pos, index in breaks] + [len(text)]
+            return '\n'.join(text[i:j] for i, j in zip(bounds, bounds[1:]))
+
+    d.rewrite_blocks(cursor.blocks(), rewrite)
+
+
+def _breaks(tokens):
+    """Return the places where break_indenters() adds a newline in a line.
+
+    Returns a list of (pos, index) tuples, where pos is the position in the
+    block and index the index of the first token of the new line.
+
+    """
+    breaks = []
+    denters = []
+    nonspace_index = -1
+    for i, t in enumerate(tokens):
+        if isinstance(t, ly.lex.Indent) and t in ('{', '<<'):
+            denters.append(i)
+        elif isinstance(t, ly.lex.Dedent) and t in ('}', '>>'):
+            if denters:
+                denters.pop()
+            elif nonspace_index != -1:
+                # add newline before t
+                breaks.append((t.pos, i))
+        if not isinstance(t, ly.lex.Space):
+            nonspace_index = i
+    for i in denters:
+        if i < nonspace_index:
+            # add newline after tokens[i]
+            breaks.append((tokens[i].end, i + 1))
+    return breaks
 
 
 def move_long_comments(cursor):
     """Move line comments with more than 2 comment characters to column 0."""
-    with cursor.document as d:
-        for b in cursor.blocks():
-            tokens = d.tokens(b)
-            if (len(tokens) == 2
-                and isinstance(tokens[0], ly.lex.Space)
-                and isinstance(tokens[1], (
-                    ly.lex.lilypond.LineComment,
-                    ly.lex.scheme.LineComment))
-                    and tokens[1][:3] in ('%%%', ';;;')):
-                del d[d.position(b):d.position(b) + tokens[1].pos]
+    d = cursor.document
+
+    def rewrite(block):
+        tokens = d.tokens(block)
+        if (tokens and isinstance(tokens[0], ly.lex.Space)
+                and _is_long_comment(tokens[1:])):
+            return d.text(block)[tokens[1].pos:]
+
+    d.rewrite_blocks(cursor.blocks(), rewrite)
+
+
+def _is_long_comment(tokens):
+    """Return True if the tokens of a line, without its indent, are a line
+    comment that move_long_comments() moves to column 0."""
+    return (len(tokens) == 1
+            and isinstance(tokens[0], (
+                ly.lex.lilypond.LineComment,
+                ly.lex.scheme.LineComment))
+            and tokens[0][:3] in ('%%%', ';;;'))
 
 
 def remove_trailing_whitespace(cursor):
     """Removes whitespace from all lines in the cursor's range."""
-    with cursor.document as d:
-        for b in cursor.blocks():
-            tokens = d.tokens(b)
-            if tokens:
-                t = tokens[-1]
-                end = d.position(b) + t.end
-                if isinstance(t, ly.lex.Space):
-                    del d[end-len(t):end]
-                elif not isinstance(t, ly.lex.String):
-                    offset = len(t) - len(t.rstrip())
-                    if offset:
-                        del d[end-offset:end]
+    d = cursor.document
+
+    def rewrite(block):
+        trailing = _trailing_whitespace(d.tokens(block))
+        if trailing:
+            start, end = trailing
+            text = d.text(block)
+            return text[:start] + text[end:]
+
+    d.rewrite_blocks(cursor.blocks(), rewrite)
+
+
+def _trailing_whitespace(tokens):
+    """Return the (start, end) positions in the block of the whitespace
+    remove_trailing_whitespace() removes at the end of the tokens, or None."""
+    if tokens:
+        t = tokens[-1]
+        if isinstance(t, ly.lex.Space):
+            return t.pos, t.end
+        elif not isinstance(t, ly.lex.String):
+            offset = len(t) - len(t.rstrip())
+            if offset:
+                return t.end - offset, t.end
 
 
 def reformat(cursor, indenter):
-    """A do-it-all function improving the LilyPond source formatting."""
-    break_indenters(cursor)
-    indenter.indent(cursor)
-    move_long_comments(cursor)
-    remove_trailing_whitespace(cursor)
+    """A do-it-all function improving the LilyPond source formatting.
+
+    The result is the same as running break_indenters(), indenter.indent(),
+    move_long_comments() and remove_trailing_whitespace() after each other,
+    but the tokens are read only once and all changes are made at once,
+    using the write_blocks() method of the document.
+
+    The lines are indented with the indent_state(), indent_line() and
+    push_indents() methods of the indenter. If the indenter has its own
+    indent() method, the tools are run separately to honour it.
+
+    """
+    if _overrides_indent(indenter):
+        break_indenters(cursor)
+        indenter.indent(cursor)
+        move_long_comments(cursor)
+        remove_trailing_whitespace(cursor)
+        return
+    d = cursor.document
+    start, end = cursor.start, cursor.end
+    start_block, end_block = cursor.start_block(), cursor.end_block()
+    indents, prev_indent = indenter.indent_state(d, start_block)
+    changes = []
+    for b in d.blocks_forward(start_block):
+        pos = d.position(b)
+        tokens = d.tokens(b)
+        # break_indenters() changes the blocks of cursor.blocks()
+        if b == start_block or end is None or pos < end:
+            breaks = _breaks(tokens)
+        else:
+            breaks = []
+        # the lines the indenter changes: from the line the cursor start is
+        # in after breaking to the line the end is in. break_indenters()
+        # replaces the text between the first and the last break at once,
+        # which moves a cursor start inside it to the first break (so the
+        # indenting starts at the first line) and a cursor end inside it to
+        # the last break
+        first, last = 0, len(breaks)
+        if b == start_block and not (breaks and breaks[0][0] < start - pos <= breaks[-1][0]):
+            first = sum(1 for offset, i in breaks if offset < start - pos)
+        if b == end_block and end is not None:
+            if breaks and breaks[0][0] <= end - pos <= breaks[-1][0]:
+                end = pos + breaks[-1][0]
+            last = sum(1 for offset, i in breaks if offset <= end - pos)
+        bounds = [(0, 0)] + breaks + [(None, len(tokens))]
+        for k in range(len(breaks) + 1):
+            offset, i = bounds[k]
+            if k:
+                changes.append((pos + offset, pos + offset, '\n'))
+            if k > last:
+                continue
+            if breaks:
+                line = ly.indent.Line(d, b, i, bounds[k + 1][1])
+            else:
+                line = ly.indent.get_line(d, b)
+            if k < first:
+                # before the range, only remember the indent
+                indenter.indent_line(indents, line, None)
+            else:
+                indent = indenter.indent_line(indents, line)
+                # the cursor end only matters in the line it is in: the other
+                # tools skip that line if the end moved to its start (see
+                # Cursor.blocks()), unless it is also the start line
+                if (b == end_block and end is not None and k == last
+                        and not (b == start_block and k == first)):
+                    line_end = end - pos - offset
+                else:
+                    line_end = None
+                changes.extend(_format_line(line, tokens[i:bounds[k + 1][1]],
+                                            indent, pos, pos + offset, line_end))
+            prev_indent = indenter.push_indents(indents, line, prev_indent)
+        if b == end_block:
+            break
+    with d:
+        d.write_blocks(changes)
+
+
+def _overrides_indent(indenter):
+    """Return True if the indenter has another indent() method than
+    ly.indent.Indenter."""
+    for cls in type(indenter).__mro__:
+        if cls is ly.indent.Indenter:
+            return False
+        elif 'indent' in vars(cls):
+            return True
+    return True
+
+
+def _format_line(line, tokens, indent, block_pos, pos, end):
+    """Return the changes reformat() makes to a line after breaking.
+
+    line is the ly.indent.Line for the tokens, indent the new indent (None if
+    unchanged), block_pos the position of the block the tokens are in and pos
+    the position of the line. end is the end of the cursor relative to the
+    line, or None if the line is not the last one of the range.
+
+    When the tools are run separately, each change moves the cursor end, and
+    once it is at the start of the line, move_long_comments() and
+    remove_trailing_whitespace() leave the line alone. So end is moved here
+    in the same way.
+
+    """
+    changes = []
+    old = line.indent
+    if old is not False:
+        if old:
+            tokens = tokens[1:]
+        if indent is None:
+            indent = old
+        elif end is not None:
+            # replacing the indent moves an end inside it to the end of the
+            # new indent, and an end after it along with the text
+            end = len(indent) if len(old) >= end else end + len(indent) - len(old)
+        # move_long_comments()
+        if (end is None or end > 0) and indent and _is_long_comment(tokens):
+            if end is not None:
+                # removing the indent moves an end inside it to the start
+                end = 0 if len(indent) >= end else end - len(indent)
+            indent = ''
+    # remove_trailing_whitespace()
+    if end is None or end > 0:
+        trailing = _trailing_whitespace(tokens)
+        if not tokens:
+            indent = ''
+        elif trailing:
+            changes.append((block_pos + trailing[0], block_pos + trailing[1], ''))
+    if old is not False and indent != old:
+        changes.insert(0, (pos, pos + len(old), indent))
+    return changes
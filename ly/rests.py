@@ -30,60 +30,62 @@ import ly.document
 import ly.lex.lilypond
 
 
-def replace_rest(cursor, replace_token):
-    """Replace full rests (r) with optional token. """
+def replace_rests(cursor, replacements):
+    r"""Replace rests of several kinds in one pass.
+
+    replacements is a dictionary mapping the kind of rest to the replacement
+    token. The kinds are 'r' (full rests), 'R' (full measure rests), 's'
+    (spacer rests) and '\\rest' (rests by rest command, i.e. a note followed
+    by \rest). Kinds not in the dictionary are left alone.
+
+    The tokens are read only once, and the changes are made using the
+    write_blocks() method of the document.
+
+    """
     source = ly.document.Source(cursor, True, tokens_with_position=True)
+    restcomm = replacements.get('\\rest')
+    changes = []
+    rest_tokens = None
     with cursor.document as d:
         for token in source:
-            if isinstance(token, ly.lex.lilypond.Rest):
-                if token == 'r':
-                    d[token.pos:token.end] = replace_token
+            if isinstance(token, ly.lex.lilypond.Note):
+                if restcomm is not None:
+                    rest_tokens = [token]
+            elif isinstance(token, ly.lex.Space):
+                if rest_tokens:
+                    rest_tokens.append(token)
+            elif isinstance(token, (ly.lex.lilypond.Rest, ly.lex.lilypond.Spacer)):
+                kind = 's' if isinstance(token, ly.lex.lilypond.Spacer) else token
+                if kind in replacements:
+                    changes.append((token.pos, token.end, replacements[kind]))
+            elif rest_tokens and isinstance(token, ly.lex.lilypond.Command):
+                if token == '\\rest':
+                    note = rest_tokens[0]
+                    changes.append((note.pos, note.end, restcomm))
+                    if len(rest_tokens) > 1:
+                        space = rest_tokens[-1]
+                        changes.append((space.pos, space.end, ''))
+                    changes.append((token.pos, token.end, ''))
+                    rest_tokens = None
+        changes.sort()
+        d.write_blocks(changes)
+
+
+def replace_rest(cursor, replace_token):
+    """Replace full rests (r) with optional token. """
+    replace_rests(cursor, {'r': replace_token})
 
 
 def replace_fmrest(cursor, replace_token):
     """Replace full measure rests (R) with optional token. """
-    source = ly.document.Source(cursor, True, tokens_with_position=True)
-    with cursor.document as d:
-        for token in source:
-            if isinstance(token, ly.lex.lilypond.Rest):
-                if token == 'R':
-                    d[token.pos:token.end] = replace_token
+    replace_rests(cursor, {'R': replace_token})
 
 
 def replace_spacer(cursor, replace_token):
     """Replace spacer rests (s) with optional token. """
-    source = ly.document.Source(cursor, True, tokens_with_position=True)
-    with cursor.document as d:
-        for token in source:
-            if isinstance(token, ly.lex.lilypond.Spacer):
-                d[token.pos:token.end] = replace_token
+    replace_rests(cursor, {'s': replace_token})
 
 
 def replace_restcomm(cursor, replace_token):
     r"""Replace rests by rest command (\rest) with optional token. """
-
-    def get_comm_rests(source):
-        r"""Catch all rests by rest command (\rest) from source."""
-        rest_tokens = None
-        for token in source:
-            if isinstance(token, ly.lex.lilypond.Note):
-                rest_tokens = [token]
-                continue
-            if rest_tokens and isinstance(token, ly.lex.Space):
-                rest_tokens.append(token)
-                continue
-            if rest_tokens and isinstance(token, ly.lex.lilypond.Command):
-                if token == '\\rest':
-                    rest_tokens.append(token)
-                    yield rest_tokens
-                    rest_tokens = None
-
-    source = ly.document.Source(cursor, True, tokens_with_position=True)
-    with cursor.document as d:
-        for rt in get_comm_rests(source):
-            note = rt[0]
-            space = rt[-2]
-            comm = rt[-1]
-            d[note.pos:note.end] = replace_token
-            del d[space.pos:space.end]
-            del d[comm.pos:comm.end]
+    replace_rests(cursor, {'\\rest': replace_token})
@@ -28,8 +28,10 @@ All functions expect a ly.document.Cursor with the selected range.
 
 from __future__ import unicode_literals
 
+import bisect
 import collections
 import itertools
+from fractions import Fraction
 
 import ly.document
 import ly.lex.lilypond
@@ -140,6 +142,10 @@ def music_items(cursor, command=False, chord=False, partial=ly.document.INSIDE):
     - partial: ly.document.INSIDE (default), PARTIAL or OUTSIDE.
       See the documentation of ly.document.Source.__init__().
 
+    With the default partial value, the items are read using an index that
+    is stored in the document's checkpoints, so a subsequent call only needs
+    to read the text from the block that was changed. See _index_items().
+
     """
     skip_parsers = ()
     if not command:
@@ -147,8 +153,26 @@ def music_items(cursor, command=False, chord=False, partial=ly.document.INSIDE):
     if not chord:
         skip_parsers += (ly.lex.lilypond.ParseChord,)
 
-    source = ly.document.Source(cursor, True, partial=partial, tokens_with_position=True)
+    if partial == ly.document.INSIDE:
+        items = _index_items(cursor, skip_parsers, (command, chord))
+    else:
+        source = ly.document.Source(cursor, True, partial=partial, tokens_with_position=True)
+        items = _music_items(source, skip_parsers)
+    for item in items:
+        if not isinstance(item, int):
+            yield item
+
 
+def _music_items(source, skip_parsers):
+    """Yield music_item instances from the Source.
+
+    The Source must follow the state and have tokens with position.
+
+    Also yields the position of every block where reading can be restarted,
+    i.e. where no music item was being read at the end of the previous
+    block. Reading from there gives the same items as reading on would.
+
+    """
     def mk_item(l):
         """Convert a list of tokens to a music_item instance."""
         tokens = []
@@ -171,27 +195,34 @@ def music_items(cursor, command=False, chord=False, partial=ly.document.INSIDE):
         return music_item(tokens, dur_tokens, may_remove, insert_pos, pos, end)
 
     for token in source:
+        if isinstance(token, ly.lex.Newline):
+            yield token.end
+            continue
         if isinstance(source.state.parser(), skip_parsers):
             continue
-        # make sure to skip the duration tokens in a \tuplet command
-        if token == '\\tuplet':
-            lis = [token]
-            for token in source:
-                if isinstance(token, ly.lex.lilypond.Duration):
-                    lis.append(token)
-                    for token in source:
-                        if not isinstance(token, ly.lex.lilypond.Duration):
-                            break
-                        lis.append(token)
-                    break
-                elif isinstance(token, ly.lex.Numeric):
-                    lis.append(token)
-                elif not isinstance(token, ly.lex.Space):
-                    break
-            yield mk_item(lis)
-
         length_seen = False
-        while isinstance(token, _start):
+        while token == '\\tuplet' or isinstance(token, _start):
+            if token == '\\tuplet':
+                # make sure to skip the duration tokens in a \tuplet command,
+                # also when it directly follows another music item
+                lis = [token]
+                for token in source:
+                    if isinstance(token, ly.lex.lilypond.Duration):
+                        lis.append(token)
+                        for token in source:
+                            if not isinstance(token, ly.lex.lilypond.Duration):
+                                break
+                            lis.append(token)
+                        break
+                    elif isinstance(token, ly.lex.Numeric):
+                        lis.append(token)
+                    elif not isinstance(token, ly.lex.Space):
+                        break
+                else:
+                    yield mk_item(lis)
+                    return
+                yield mk_item(lis)
+                continue
             lis = [token]
             if isinstance(token, ly.lex.lilypond.Length):
                 length_seen = True
@@ -221,90 +252,288 @@ def music_items(cursor, command=False, chord=False, partial=ly.document.INSIDE):
                 break
 
 
+def _index_items(cursor, skip_parsers, key):
+    """Yield the music items in the cursor's range, like _music_items().
+
+    The items of the document are stored in the document's checkpoints,
+    together with (position, count) tuples for the blocks where reading can
+    be restarted, count being the number of items before that block. A
+    change of the document removes them from the changed block, so only the
+    text after the last remaining restart point needs to be read again.
+
+    The items between the first and the last restart point in the range are
+    taken from the index, the text before and after those is read directly.
+    The index is only used when it reaches the start of the range already,
+    so reading a range near the end never reads the whole document. If the
+    document does not store checkpoints, the range is just read.
+
+    """
+    document = cursor.document
+    start, end = cursor.start, cursor.end
+    points = document.checkpoints(('rhythm',) + key)
+    index = document.checkpoints(('rhythm items',) + key)
+    if points is None or index is None:
+        # the document does not store checkpoints
+        last = -1
+    else:
+        last, count = points[-1] if points else (0, 0)
+        del index[count:]   # items after the last restart point may be outdated
+    if start > last:
+        source = ly.document.Source(cursor, True, tokens_with_position=True)
+        for item in _music_items(source, skip_parsers):
+            yield item
+        return
+
+    # extend the index up to a restart point at or after the end
+    if last <= document.size() and (end is None or last < end):
+        c = ly.document.Cursor(document, last)
+        source = ly.document.Source(c, True, tokens_with_position=True)
+        for item in _music_items(source, skip_parsers):
+            if isinstance(item, int):
+                points.append((item, len(index)))
+                if end is not None and item >= end:
+                    break
+            else:
+                index.append((item.pos, item))
+        else:
+            # the index is complete, add a restart point after the end
+            points.append((document.size() + 1, len(index)))
+
+    # read until we are at a restart point, find the item count there
+    if start == 0:
+        count = 0
+    else:
+        c = ly.document.Cursor(document, start, end)
+        source = ly.document.Source(c, True, tokens_with_position=True)
+        for item in _music_items(source, skip_parsers):
+            if isinstance(item, int):
+                i = bisect.bisect_left(points, (item,))
+                if i < len(points) and points[i][0] == item:
+                    count = points[i][1]
+                    break
+            else:
+                yield item
+        else:
+            return
+
+    # take the items from the index until the last restart point in range
+    if end is None:
+        last, end_count = points[-1]
+    else:
+        i = bisect.bisect_right(points, (end, len(index)))
+        last, end_count = points[i - 1] if i else (0, 0)
+    for pos, item in index[count:end_count]:
+        yield item
+
+    # read the rest
+    if end is not None and last < end:
+        c = ly.document.Cursor(document, last, end)
+        source = ly.document.Source(c, True, tokens_with_position=True)
+        for item in _music_items(source, skip_parsers):
+            yield item
+
+
 def preceding_duration(cursor):
-    """Return a preceding duration before the cursor, or an empty list."""
-    tokens = ly.document.Runner.at(cursor).backward()
+    """Return a preceding duration before the cursor, or an empty list.
+
+    The last durations of every block before the cursor's block are stored
+    in the block_cache() of the document (if available), so a long stretch
+    of text without durations is only read once.
+
+    """
+    d = cursor.document
+    runner = ly.document.Runner.at(cursor)
+    lis = []
+    if not _durations(runner.backward_line(), lis):
+        for block in d.blocks_backward(d.previous_block(runner.block)):
+            if lis:
+                # the durations may continue on the previous line
+                if _durations(reversed(d.tokens(block)), lis):
+                    break
+            else:
+                last, complete = _block_durations(d, block)
+                lis.extend(last)
+                if complete:
+                    break
+    lis.reverse()
+    return lis
+
+
+def _durations(tokens, lis):
+    """Collect the last Duration tokens in lis from the backward tokens.
+
+    If lis is empty, Durations are searched for first, otherwise the
+    Durations must follow directly (only separated by whitespace).
+    Returns True if a token was found that ends the durations.
+
+    """
     for t in tokens:
         if isinstance(t, ly.lex.lilypond.Duration):
-            lis = [t]
-            for t in tokens:
-                if isinstance(t, ly.lex.lilypond.Duration):
-                    lis.append(t)
-                elif not isinstance(t, ly.lex.Space):
-                    break
-            lis.reverse()
-            return lis
-    return []
+            lis.append(t)
+        elif lis and not isinstance(t, ly.lex.Space):
+            return True
+    return False
+
+
+def _block_durations(document, block):
+    """Return (durations, complete) for the last durations in the block.
+
+    durations is a tuple of the Duration tokens in backward order, complete
+    is True if the durations do not continue on the previous line. The
+    result is stored in the block_cache() of the document, if available.
+
+    """
+    cache = document.block_cache(block)
+    try:
+        return cache['ly.rhythm.durations']
+    except (TypeError, KeyError):
+        lis = []
+        complete = _durations(reversed(document.tokens(block)), lis)
+        result = tuple(lis), complete
+        if cache is not None:
+            cache['ly.rhythm.durations'] = result
+        return result
 
 
 def rhythm_double(cursor):
     """Doubles all duration values."""
-    with cursor.document as d:
-        for item in music_items(cursor):
-            for token in item.dur_tokens:
-                if isinstance(token, ly.lex.lilypond.Length):
-                    try:
-                        i = durations.index(token)
-                    except ValueError:
-                        pass
-                    else:
-                        if i > 0:
-                            d[token.pos:token.end] = durations[i - 1]
-                    break
+    rewrite_durations(cursor, _double)
 
 
 def rhythm_halve(cursor):
     """Halves all duration values."""
-    with cursor.document as d:
-        for item in music_items(cursor):
-            for token in item.dur_tokens:
-                if isinstance(token, ly.lex.lilypond.Length):
-                    try:
-                        i = durations.index(token)
-                    except ValueError:
-                        pass
-                    else:
-                        if i < len(durations) - 1:
-                            d[token.pos:token.end] = durations[i + 1]
-                    break
+    rewrite_durations(cursor, _halve)
 
 
 def rhythm_dot(cursor):
     """Add a dot to all durations."""
-    with cursor.document as d:
-        for item in music_items(cursor):
-            for token in item.dur_tokens:
-                if isinstance(token, ly.lex.lilypond.Length):
-                    d[token.end:token.end] = "."
-                    break
+    rewrite_durations(cursor, _dot)
 
 
 def rhythm_undot(cursor):
     """Remove one dot from all durations."""
-    with cursor.document as d:
-        for item in music_items(cursor):
-            for token in item.dur_tokens:
-                if isinstance(token, ly.lex.lilypond.Dot):
-                    del d[token.pos:token.end]
-                    break
+    rewrite_durations(cursor, _undot)
+
+
+def rhythm_scale(cursor, numerator, denominator=1):
+    """Multiply the scaling of all durations with numerator / denominator.
+
+    E.g. with 2 and 3, ``4`` becomes ``4*2/3`` and ``8*3/2`` becomes ``8``.
+    The durations of \\tempo and \\tuplet commands are not changed.
+
+    """
+    factor = Fraction(numerator, denominator)
+    rewrite_durations(cursor, lambda tokens: _scale(tokens, factor), False)
 
 
 def rhythm_remove_scaling(cursor):
     """Remove the scaling (like ``*3``, ``*1/3``) from all durations."""
-    with cursor.document as d:
-        for item in music_items(cursor):
-            for token in item.dur_tokens:
-                if isinstance(token, ly.lex.lilypond.Scaling):
-                    del d[token.pos:token.end]
+    rewrite_durations(cursor, _remove_scaling)
 
 
 def rhythm_remove_fraction_scaling(cursor):
     """Remove the scaling containing fractions (like ``*1/3``) from all durations."""
+    rewrite_durations(cursor, _remove_fraction_scaling)
+
+
+def rewrite_durations(cursor, transform, commands=True):
+    """Change the durations in the cursor's range using the transform.
+
+    The transform is called with a tuple of the Duration tokens of a music
+    item, and returns a sequence with the new text for every token, or None
+    if the duration does not change. It is called only once for the same
+    tokens, the result is stored in a table.
+
+    If commands is False, the durations of \\tempo and \\tuplet commands
+    are not changed.
+
+    The changes are written using the write_blocks() method of the document,
+    making only one change per block.
+
+    """
+    table = {}
+    changes = []
+    for item in music_items(cursor):
+        tokens = tuple(item.dur_tokens)
+        if not tokens or (not commands and ('\\tempo' in item.tokens or '\\tuplet' in item.tokens)):
+            continue
+        try:
+            new = table[tokens]
+        except KeyError:
+            new = table[tokens] = transform(tokens)
+        if new:
+            for t, text in zip(tokens, new):
+                if text != t:
+                    changes.append((t.pos, t.end, text))
     with cursor.document as d:
-        for item in music_items(cursor):
-            for token in item.dur_tokens:
-                if isinstance(token, ly.lex.lilypond.Scaling) and '/' in token:
-                    del d[token.pos:token.end]
+        d.write_blocks(changes)
+
+
+# maps the Length token text to the index in the durations list
+_durations_index = dict((d, i) for i, d in enumerate(durations))
+
+
+def _length(tokens, step):
+    """Return new texts with the first Length token moved step places in durations."""
+    for i, t in enumerate(tokens):
+        if isinstance(t, ly.lex.lilypond.Length):
+            j = _durations_index.get(t)
+            if j is not None and 0 <= j + step < len(durations):
+                return tokens[:i] + (durations[j + step],) + tokens[i+1:]
+            return
+
+
+def _double(tokens):
+    """Transform for rhythm_double()."""
+    return _length(tokens, -1)
+
+
+def _halve(tokens):
+    """Transform for rhythm_halve()."""
+    return _length(tokens, 1)
+
+
+def _dot(tokens):
+    """Transform for rhythm_dot()."""
+    for i, t in enumerate(tokens):
+        if isinstance(t, ly.lex.lilypond.Length):
+            return tokens[:i] + (t + ".",) + tokens[i+1:]
+
+
+def _undot(tokens):
+    """Transform for rhythm_undot()."""
+    for i, t in enumerate(tokens):
+        if isinstance(t, ly.lex.lilypond.Dot):
+            return tokens[:i] + ("",) + tokens[i+1:]
+
+
+def _remove_scaling(tokens):
+    """Transform for rhythm_remove_scaling()."""
+    return tuple("" if isinstance(t, ly.lex.lilypond.Scaling) else t for t in tokens)
+
+
+def _remove_fraction_scaling(tokens):
+    """Transform for rhythm_remove_fraction_scaling()."""
+    return tuple("" if isinstance(t, ly.lex.lilypond.Scaling) and '/' in t else t
+                 for t in tokens)
+
+
+def _scale(tokens, factor):
+    """Transform for rhythm_scale(), factor is a Fraction."""
+    new = []
+    index = len(tokens)     # where to put the scaling
+    for i, t in enumerate(tokens):
+        if isinstance(t, ly.lex.lilypond.Scaling):
+            factor *= Fraction(t[1:])
+            index = min(index, i)
+            t = ""
+        new.append(t)
+    text = "" if factor == 1 else "*{0}".format(factor)
+    if index < len(tokens):
+        new[index] = text
+    else:
+        new[-1] += text
+    return new
 
 
 def rhythm_remove(cursor):
@@ -23,6 +23,7 @@ Utility functions.
 
 from __future__ import unicode_literals
 
+import array
 import string
 
 
@@ -121,3 +122,40 @@ def mkid(*args):
         result.append(a[:1].upper())
         result.append(a[1:])
     return "".join(result)
+
+
+class ColumnTable(object):
+    """Base class for a table stored in columns.
+
+    The columns class attribute is a tuple of (name, typecode) tuples. For
+    every column an attribute with that name is set to an empty
+    array.array of that typecode. The columns should always have the same
+    length, one value for every row.
+
+    """
+    columns = ()
+
+    def __init__(self):
+        for name, typecode in self.columns:
+            setattr(self, name, array.array(typecode))
+
+    def __len__(self):
+        return len(getattr(self, self.columns[0][0]))
+
+    def rows(self):
+        """Yield tuples with the values of all columns, in the columns order."""
+        return zip(*(getattr(self, name) for name, typecode in self.columns))
+
+    def numpy(self):
+        """Return a dictionary mapping the column names to NumPy arrays.
+
+        The NumPy arrays share the memory with our columns, so do not add
+        rows while using them. Raises ImportError if NumPy is not available.
+
+        """
+        import numpy
+        result = {}
+        for name, typecode in self.columns:
+            col = getattr(self, name)
+            result[name] = numpy.frombuffer(col, numpy.dtype(typecode)) if col else numpy.array((), typecode)
+        return result
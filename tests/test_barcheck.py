@@ -0,0 +1,101 @@
+"""Tests for ly.barcheck."""
+from fractions import Fraction
+
+import ly.barcheck
+import ly.document
+import ly.music
+
+
+def insert(text, start=0, end=None):
+    """Return text after inserting bar checks in the range."""
+    d = ly.document.Document(text)
+    ly.barcheck.insert(ly.document.Cursor(d, start, end))
+    return d.plaintext()
+
+
+def check(text):
+    """Return the positions of the misplaced bar checks in the text."""
+    d = ly.document.Document(text)
+    return [node.position for node in ly.barcheck.check(ly.document.Cursor(d))]
+
+
+def test_insert():
+    assert (insert("{ c'4 d' e' f' g' a' b' c'' }")
+            == "{ c'4 d' e' f' | g' a' b' c'' }")
+
+
+def test_insert_pickup():
+    assert (insert("{ \\partial 4 g4 c'4 d' e' f' g'1 }")
+            == "{ \\partial 4 g4 | c'4 d' e' f' | g'1 }")
+
+
+def test_insert_time_change():
+    assert (insert("{ \\time 3/4 c'4 d' e' \\time 2/4 f' g' a'2 }")
+            == "{ \\time 3/4 c'4 d' e' | \\time 2/4 f' g' | a'2 }")
+
+
+def test_insert_cadenza():
+    assert (insert("{ c'1 \\cadenzaOn c'4 d' e' \\cadenzaOff f'1 }")
+            == "{ c'1 | \\cadenzaOn c'4 d' e' \\cadenzaOff f'1 }")
+
+
+def test_insert_simultaneous():
+    assert (insert("{ << { c'2 d' e'1 } \\\\ { c'1 e'4 f' g'2 } >> c'1 }")
+            == "{ << { c'2 d' | e'1 } \\\\ { c'1 | e'4 f' g'2 } >> | c'1 }")
+
+
+def test_insert_variable():
+    """Music in a variable gets the measures of the place it is used."""
+    assert (insert("mel = { c'2 d' e' f' }\n{ \\time 2/4 \\mel }")
+            == "mel = { c'2 | d' | e' | f' }\n{ \\time 2/4 \\mel }")
+
+
+def test_insert_unfold():
+    """Items read more than once must start a measure every time."""
+    text = "{ \\repeat unfold 2 { c'4 d' e' } f' }"
+    assert insert(text) == text
+    assert (insert("{ c'1 \\repeat unfold 2 { c'2 d' } e'1 }")
+            == "{ c'1 | \\repeat unfold 2 { c'2 d' } | e'1 }")
+
+
+def test_insert_previous_line():
+    """A bar check at the start of a line goes to the previous line."""
+    assert (insert("{\n  c'1\n  d'1\n  e'1 % comment\n  f'1\n}")
+            == "{\n  c'1 |\n  d'1 |\n  e'1 % comment\n  | f'1\n}")
+
+
+def test_insert_range():
+    assert insert("{ c'1 d' e' f' }", 5, 12) == "{ c'1 | d' | e' f' }"
+
+
+def test_insert_existing():
+    assert (insert("{ c'4 d' e' f' | g'2 | a'2 b'1 }")
+            == "{ c'4 d' e' f' | g'2 | a'2 | b'1 }")
+
+
+def test_check():
+    assert check("{ c'4 d' e' f' | g'2 | a'2 b'1 }") == [21]
+    assert check("{ \\partial 4 g4 | c'1 | d'1 }") == []
+
+
+def test_check_cadenza():
+    """A bar check in a cadenza is at the time the cadenza started."""
+    assert check("{ c'4 d' \\cadenzaOn e' | f' \\cadenzaOff g' a' | b'1 }") == [23]
+    assert check("{ c'1 \\cadenzaOn c'4 | d' \\cadenzaOff | e'1 }") == []
+
+
+def test_timeline():
+    music = ly.music.document(ly.document.Document(
+        "{ \\partial 4 g4 c'2 | d'2 e'1 }"))
+    timeline = ly.barcheck.Timeline(music[0])
+    assert sorted(timeline.measure_starts()) == [
+        Fraction(1, 4), Fraction(5, 4), Fraction(9, 4)]
+    assert [time for time, voice, node in timeline.barchecks] == [Fraction(3, 4)]
+    assert sorted(timeline.insertions()) == [16, 26]
+    assert [node.position for node in timeline.misplaced()] == [20]
+
+
+def test_insert_alternative():
+    """No bar check before \\alternative or between the alternatives."""
+    assert (insert("{ \\repeat volta 2 { c1 d } \\alternative { { e1 } { f1 } } g1 }")
+            == "{ \\repeat volta 2 { c1 | d } \\alternative { { | e1 } { | f1 } } | g1 }")
@@ -0,0 +1,166 @@
+"""Tests for ly.music.event."""
+from fractions import Fraction
+
+import pytest
+
+import ly.document
+import ly.music
+import ly.music.event
+
+
+def music(text):
+    """Return the music Document for the text."""
+    return ly.music.document(ly.document.Document(text))
+
+
+def table(text, **kwargs):
+    """Return an EventTable with the music of the text."""
+    t = ly.music.event.EventTable(**kwargs)
+    t.read(music(text))
+    return t
+
+
+def test_relative():
+    t = table("\\relative c'' { c4 e g c, }")
+    assert list(t.rows()) == [
+        (0.0, 0.25, 0, 0.0, 2, 16, 0, 0),
+        (0.25, 0.25, 2, 0.0, 2, 19, 0, 0),
+        (0.5, 0.25, 4, 0.0, 2, 21, 0, 0),
+        (0.75, 0.25, 0, 0.0, 2, 23, 0, 0),
+    ]
+    assert t.kinds == ['Note']
+    # without start pitch
+    assert list(table("\\relative { c'4 }").octave) == [2]
+    assert list(table("\\relative { c'4 }", first_pitch_absolute=True).octave) == [1]
+
+
+def test_chord_q():
+    """A chord yields a row for every note, also when repeated with q."""
+    t = table("\\relative { <c' e g>4 q8 d }")
+    assert list(t.rows()) == [
+        (0.0, 0.25, 0, 0.0, 2, 13, 0, 0),
+        (0.0, 0.25, 2, 0.0, 2, 16, 0, 0),
+        (0.0, 0.25, 4, 0.0, 2, 18, 0, 0),
+        (0.25, 0.125, 0, 0.0, 2, 22, 0, 1),
+        (0.25, 0.125, 2, 0.0, 2, 22, 0, 1),
+        (0.25, 0.125, 4, 0.0, 2, 22, 0, 1),
+        (0.375, 0.125, 1, 0.0, 2, 25, 0, 2),
+    ]
+    assert t.kinds == ['Chord', 'Q', 'Note']
+
+
+def test_rests():
+    t = table("{ c'4 r4 s2 }")
+    assert list(t.note) == [0, -1, -1]
+    assert [t.kinds[k] for k in t.kind] == ['Note', 'Rest', 'Skip']
+
+
+def test_contexts():
+    t = table("\\new StaffGroup << \\new Staff = \"up\" { c'1 } "
+              "\\new Staff { \\new Voice { d'2 } } >>")
+    assert [t.contexts[c] for c in t.context] == [
+        (('StaffGroup', None), ('Staff', 'up')),
+        (('StaffGroup', None), ('Staff', None), ('Voice', None)),
+    ]
+    assert list(t.onset) == [0.0, 0.0]
+    assert list(t.duration) == [1.0, 0.5]
+
+
+def test_tick_resolution():
+    assert ly.music.event.tick_resolution(music("{ c'4 d'8 }")) == 8
+    assert ly.music.event.tick_resolution(music("{ \\times 2/3 { c'8 d' e' } f'4 }")) == 12
+    with pytest.raises(ValueError):
+        ly.music.event.TickEvents(8).read(music("{ \\times 2/3 { c'8 d' e' } }")[0])
+
+
+def test_ticks_agree():
+    """Times computed with ticks are the same as with Fractions."""
+    text = ("{ \\times 2/3 { c'8 d' e' } f'4. g'16 \\grace a'16 b'4*2/3 "
+            "<< { c''2 } \\\\ { d''4 e'' } >> \\tuplet 5/4 { f''16 g'' a'' b'' c''' } }")
+    doc = music(text)
+    fraction = ly.music.event.Events()
+    ticks = ly.music.event.TickEvents(doc.tick_resolution())
+    assert ticks.fraction(ticks.read(doc[0])) == fraction.read(doc[0])
+    times = []
+    for position in range(len(text) + 1):
+        doc.ticks = False
+        time = doc.time_position(position)
+        doc.ticks = True
+        times.append(doc.time_position(position))
+        assert times[-1] == time
+    assert Fraction(1, 12) in times
+
+
+def measure_index(text):
+    """Return a MeasureIndex for the first music expression in the text."""
+    return ly.music.event.MeasureIndex(music(text)[0])
+
+
+def test_measures_partial():
+    text = "{ \\partial 4 g4 c'1 R1*2 d'1 }"
+    index = measure_index(text)
+    assert index.first == 0
+    assert len(index) == 5
+    assert index.times == [0, Fraction(1, 4), Fraction(5, 4), Fraction(9, 4), Fraction(13, 4)]
+    assert index.end == Fraction(17, 4)
+    # a multi-measure rest is the position of all the measures it fills
+    assert [index.position(m) for m in range(5)] == [13, 16, 20, 20, 25]
+    assert index.time(2) == Fraction(5, 4)
+    assert index.measure(Fraction(3, 2)) == 2
+    assert index.measure_at(text.index("d'")) == 4
+    assert index.measure_at(0) is None
+    with pytest.raises(IndexError):
+        index.time(-1)
+
+
+def test_measures_time():
+    text = "{ \\time 3/4 c'2. d'2. \\time 2/4 e'2 f'2 }"
+    index = measure_index(text)
+    assert index.first == 1
+    assert index.times == [0, Fraction(3, 4), Fraction(3, 2), Fraction(2)]
+    assert [index.position(m) for m in range(1, 5)] == [12, 17, 32, 36]
+    assert index.measure_at(text.index("e'")) == 3
+
+
+def test_measures_cadenza():
+    """The measure does not advance during a cadenza."""
+    text = "{ c'1 \\cadenzaOn c'4 d' e' \\cadenzaOff f'1 g'1 }"
+    index = measure_index(text)
+    assert index.times == [0, 1, Fraction(11, 4)]
+    assert index.measure_at(text.index("f'")) == 2
+    assert index.measure_at(text.index("g'")) == 3
+
+
+def test_measures_measure_length():
+    index = measure_index("{ \\set Timing.measureLength = #(ly:make-moment 3/4) c'2. d'2. }")
+    assert index.times == [0, Fraction(3, 4)]
+    assert index.positions == [52, 57]
+
+
+def test_tick_measure_index():
+    text = "{ \\partial 4 g4 \\times 2/3 { c'2 d' e' } \\time 3/4 f'2. g'2. }"
+    doc = music(text)
+    index = ly.music.event.MeasureIndex(doc[0])
+    ticks = ly.music.event.TickMeasureIndex(doc[0], doc.tick_resolution())
+    assert ticks.times == index.times
+    assert ticks.positions == index.positions
+    assert ticks.first == index.first == 0
+
+
+def test_document_measure_index():
+    """The index is made for toplevel music, \\score music and assignments."""
+    for text in (
+            "{ \\partial 4 c'4 | d'1 | e'1 }",
+            "m = { \\partial 4 c'4 | d'1 | e'1 }",
+            "\\score { \\new Staff { \\partial 4 c'4 | d'1 | e'1 } \\layout { } }"):
+        for ticks in (False, True):
+            doc = music(text)
+            doc.ticks = ticks
+            position = text.index("d'")
+            index = doc.measure_index(position)
+            assert isinstance(index, ly.music.event.TickMeasureIndex) == ticks
+            assert index.times == [0, Fraction(1, 4), Fraction(5, 4)]
+            assert index.end == Fraction(9, 4)
+            assert index.measure_at(position) == 1
+            # the index is kept
+            assert doc.measure_index(text.index("e'")) is index
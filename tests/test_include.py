@@ -0,0 +1,46 @@
+"""Tests for following \\include commands in ly.music."""
+from fractions import Fraction
+
+import ly.document
+import ly.music
+import ly.music.items
+
+
+def load(path):
+    """Return the music Document for the file."""
+    return ly.music.document(ly.document.Document.load(str(path)))
+
+
+def test_shared_include(tmpdir):
+    """Variables in an included file resolve against the including file."""
+    ly.music.items.clear_include_cache()
+    tmpdir.join('global.ly').write('melody = { \\foo }\n')
+    tmpdir.join('a.ly').write(
+        "foo = { c'4 d'4 }\n\\include \"global.ly\"\n{ \\melody }\n")
+    tmpdir.join('b.ly').write(
+        "foo = { e'1 f'1 g'1 }\n\\include \"global.ly\"\n{ \\melody }\n")
+    a = load(tmpdir.join('a.ly'))
+    list(a.iter_music())
+    b = load(tmpdir.join('b.ly'))
+    list(b.iter_music())
+    assert b[-1].length() == 3
+    assert a[-1].length() == Fraction(1, 2)
+    # the included file itself is only loaded once
+    assert a[1]._document.document is b[1]._document.document
+
+
+def test_self_contained_include(tmpdir):
+    """A self-contained included file is parsed once and shared."""
+    ly.music.items.clear_include_cache()
+    tmpdir.join('style.ly').write(
+        "melody = { c'4 d'4 }\n\\paper { indent = 0 }\n")
+    tmpdir.join('a.ly').write("\\include \"style.ly\"\n{ \\melody }\n")
+    tmpdir.join('b.ly').write("\\include \"style.ly\"\n{ \\melody e'2 }\n")
+    a = load(tmpdir.join('a.ly'))
+    b = load(tmpdir.join('b.ly'))
+    assert a[-1].length() == Fraction(1, 2)
+    assert b[-1].length() == 1
+    style = a.get_included_document_node(a[0])
+    assert style.is_self_contained()
+    assert style is b.get_included_document_node(b[0])
+    assert style.include_node is None
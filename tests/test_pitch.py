@@ -0,0 +1,149 @@
+"""Tests for the pitch manipulations in ly.pitch."""
+import glob
+import io
+import os
+
+import pytest
+
+import ly.document
+import ly.pitch
+import ly.pitch.abs2rel
+import ly.pitch.extract
+import ly.pitch.pipeline
+import ly.pitch.rel2abs
+import ly.pitch.stream
+import ly.pitch.translate
+import ly.pitch.transpose
+
+
+TEXT = (
+    "\\version \"2.18.2\"\n"
+    "music = \\relative c'' { c4 d es fis | g1 <c, e g>2 bes'8 a \\times 2/3 { g f e } }\n"
+    "\\score {\n"
+    "  \\new Staff { \\key es \\major \\transpose c d \\music \\relative { a'4 ( b ) c2 } }\n"
+    "}\n"
+)
+
+
+def texts():
+    """Yield the texts to test with."""
+    yield TEXT
+    filebase = os.path.join(os.path.dirname(__file__), 'test_xml_files')
+    for filename in sorted(glob.glob(filebase + "/*.ly")):
+        with io.open(filename, encoding='utf-8') as f:
+            yield f.read()
+
+
+def transposers():
+    """Return a list of transposers to test with."""
+    Pitch = ly.pitch.Pitch
+    return [
+        ly.pitch.transpose.Transposer(Pitch(0, 0, 0), Pitch(1, 0, 0)),
+        ly.pitch.transpose.Transposer(Pitch(0, 0, 0), Pitch(4, -0.5, -1)),
+        ly.pitch.transpose.Simplifier(),
+    ]
+
+
+def test_pipeline():
+    """pipeline() gives the same result as running the steps separately."""
+    t1, t2, simplifier = transposers()
+    for text in texts():
+        d1 = ly.document.Document(text)
+        d2 = ly.document.Document(text)
+        ly.pitch.pipeline.pipeline(ly.document.Cursor(d1), [
+            t1, t2, 'english',
+            ly.pitch.rel2abs.rel2abs,
+            simplifier,
+        ])
+        ly.pitch.transpose.transpose(ly.document.Cursor(d2), t1)
+        ly.pitch.transpose.transpose(ly.document.Cursor(d2), t2)
+        ly.pitch.translate.translate(ly.document.Cursor(d2), 'english')
+        ly.pitch.rel2abs.rel2abs(ly.document.Cursor(d2), 'english')
+        ly.pitch.transpose.transpose(ly.document.Cursor(d2), simplifier, 'english')
+        assert d1.plaintext() == d2.plaintext()
+
+
+def test_stream():
+    """The ly.pitch.stream functions give the same result as the Document
+    functions."""
+    transposer = transposers()[1]
+    functions = [
+        (ly.pitch.stream.rel2abs, ly.pitch.rel2abs.rel2abs, ()),
+        (ly.pitch.stream.abs2rel, ly.pitch.abs2rel.abs2rel, ()),
+        (ly.pitch.stream.transpose, ly.pitch.transpose.transpose, (transposer,)),
+        (ly.pitch.stream.translate, ly.pitch.translate.translate, ('deutsch',)),
+    ]
+    for text in texts():
+        for stream_function, function, args in functions:
+            output = io.StringIO()
+            stream_function(io.StringIO(text), output, *args)
+            d = ly.document.Document(text)
+            function(ly.document.Cursor(d), *args)
+            assert output.getvalue() == d.plaintext()
+
+
+def test_transpose_text():
+    """transpose_text() gives the same results as transpose()."""
+    for text in texts():
+        results = []
+        for transposer in transposers():
+            d = ly.document.Document(text)
+            ly.pitch.transpose.transpose(ly.document.Cursor(d), transposer)
+            results.append(d.plaintext())
+        assert ly.pitch.transpose.transpose_text(text, transposers()) == results
+        assert ly.pitch.transpose.transpose_text(text, transposers(), processes=2) == results
+
+
+def test_translate_bulk():
+    """Translating with bulk=True gives the same result."""
+    for text in texts():
+        d1 = ly.document.Document(text)
+        d2 = ly.document.Document(text)
+        start = len(text) // 3
+        ly.pitch.translate.translate(ly.document.Cursor(d1, start), 'english')
+        ly.pitch.translate.translate(ly.document.Cursor(d2, start), 'english', bulk=True)
+        assert d1.plaintext() == d2.plaintext()
+    d = ly.document.Document("\\language \"deutsch\" { c4 cis es b h }")
+    assert ly.pitch.translate.translate(ly.document.Cursor(d), 'english', bulk=True)
+    assert d.plaintext() == "\\language \"english\" { c4 cs ef bf b }"
+
+
+def extract(text, start=0, end=None):
+    """Return the rows of the PitchTable of the text in the range."""
+    cursor = ly.document.Cursor(ly.document.Document(text), start, end)
+    return list(ly.pitch.extract.extract(cursor).rows())
+
+
+def test_extract():
+    assert extract("{ <c' es' g'>4 fis,8 }") == [
+        (0, 0.0, 1, 3), (2, -0.5, 1, 6), (4, 0.0, 1, 10), (3, 0.5, -1, 15)]
+    # pitch names in other languages
+    assert extract("\\language \"deutsch\" { cis'4 es b h }") == [
+        (0, 0.5, 1, 22), (2, -0.5, 0, 28), (6, -0.5, 0, 31), (6, 0.0, 0, 33)]
+
+
+def test_extract_relative():
+    assert extract("\\relative c'' { c4 e g c, }") == [
+        (0, 0.0, 2, 16), (2, 0.0, 2, 19), (4, 0.0, 2, 21), (0, 0.0, 2, 23)]
+    # a chord repetition has no pitch names
+    assert extract("\\relative { <c' e g>4 q8 d }") == [
+        (0, 0.0, 2, 13), (2, 0.0, 2, 16), (4, 0.0, 2, 18), (1, 0.0, 2, 25)]
+
+
+def test_extract_range():
+    """A range starting inside \\relative music gets absolute octaves."""
+    text = "\\relative c'' { c4 e g c, d }"
+    assert extract(text, text.index('g')) == [
+        (4, 0.0, 2, 21), (0, 0.0, 2, 23), (1, 0.0, 2, 26)]
+    assert extract(text, text.index('g'), text.index('d')) == [
+        (4, 0.0, 2, 21), (0, 0.0, 2, 23)]
+
+
+def test_pitch_slots():
+    p = ly.pitch.Pitch(1, 0.5, 2)
+    assert not hasattr(p, '__dict__')
+    c = p.copy()
+    assert (c.note, c.alter, c.octave) == (1, 0.5, 2)
+    c.transposed = True
+    with pytest.raises(AttributeError):
+        c.color = 'red'
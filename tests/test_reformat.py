@@ -0,0 +1,68 @@
+"""Tests for ly.reformat."""
+import ly.document
+import ly.indent
+import ly.reformat
+
+
+TEXT = (
+    "\\score {\n"
+    "<< \\new Staff { c'4 d'\n"
+    "e' f' }  \n"
+    "     %%% a long comment   \n"
+    "  \\new Staff { g a b\n"
+    "   c' } >>\n"
+    "  \n"
+    "      ;;; not in scheme\n"
+    "}\n"
+)
+
+
+def separately(text, start, end, indenter=ly.indent.Indenter):
+    """Return text after running the four reformat tools after each other."""
+    d = ly.document.Document(text)
+    cursor = ly.document.Cursor(d, start, end)
+    ly.reformat.break_indenters(cursor)
+    indenter().indent(cursor)
+    ly.reformat.move_long_comments(cursor)
+    ly.reformat.remove_trailing_whitespace(cursor)
+    return d.plaintext()
+
+
+def reformat(text, start, end, indenter=ly.indent.Indenter):
+    """Return text after running reformat()."""
+    d = ly.document.Document(text)
+    ly.reformat.reformat(ly.document.Cursor(d, start, end), indenter())
+    return d.plaintext()
+
+
+def test_reformat_whole_document():
+    assert reformat(TEXT, 0, None) == separately(TEXT, 0, None)
+    assert reformat(TEXT, 0, None) != TEXT
+
+
+def test_reformat_selection():
+    """Every selection gives the same result as the separate tools."""
+    for start in range(0, len(TEXT) + 1, 3):
+        for end in [None] + list(range(start, len(TEXT) + 1, 7)):
+            assert reformat(TEXT, start, end) == separately(TEXT, start, end), (start, end)
+
+
+class TabIndenter(ly.indent.Indenter):
+    """Indents with a tab instead of two spaces."""
+    def indent_line(self, indents, line, indent_blank_lines=False):
+        indent = super(TabIndenter, self).indent_line(indents, line, indent_blank_lines)
+        return indent.replace('  ', '\t') if indent else indent
+
+
+class NoIndenter(ly.indent.Indenter):
+    """Does not indent at all."""
+    def indent(self, cursor, indent_blank_lines=False):
+        pass
+
+
+def test_reformat_indenter_subclass():
+    """A subclass of Indenter is used like it is by the separate tools."""
+    for indenter in TabIndenter, NoIndenter:
+        assert reformat(TEXT, 0, None, indenter) == separately(TEXT, 0, None, indenter)
+        assert reformat(TEXT, 0, None, indenter) != reformat(TEXT, 0, None)
+    assert "\n\t\t\\new Staff" in reformat(TEXT, 0, None, TabIndenter)
@@ -0,0 +1,45 @@
+"""Tests for ly.rests."""
+import ly.document
+import ly.rests
+
+
+TEXT = "{ c4 r8 R1*2 s2 d4 \\rest <f a>4 r }"
+
+
+def run(function, text, *args, **kwargs):
+    """Return text after calling function on a cursor over the range."""
+    d = ly.document.Document(text)
+    function(ly.document.Cursor(d, kwargs.get('start', 0), kwargs.get('end')), *args)
+    return d.plaintext()
+
+
+def test_replace_rest():
+    assert run(ly.rests.replace_rest, TEXT, 's') == "{ c4 s8 R1*2 s2 d4 \\rest <f a>4 s }"
+    assert run(ly.rests.replace_rests, TEXT, {'r': 's'}) == run(ly.rests.replace_rest, TEXT, 's')
+
+
+def test_replace_fmrest():
+    assert run(ly.rests.replace_fmrest, TEXT, 'r') == "{ c4 r8 r1*2 s2 d4 \\rest <f a>4 r }"
+
+
+def test_replace_spacer():
+    assert run(ly.rests.replace_spacer, TEXT, 'r') == "{ c4 r8 R1*2 r2 d4 \\rest <f a>4 r }"
+
+
+def test_replace_restcomm():
+    """The pitch becomes the replacement and the \\rest is removed."""
+    assert run(ly.rests.replace_restcomm, TEXT, 'r') == "{ c4 r8 R1*2 s2 r4 <f a>4 r }"
+
+
+def test_replace_restcomm_without_space():
+    assert run(ly.rests.replace_restcomm, "{ c4\\rest d8.\\rest e }", 's') == "{ s4 s8. e }"
+
+
+def test_replace_rests():
+    """All kinds are replaced at once, also by an empty string."""
+    replacements = {'r': '', 'R': 's', 's': 'R', '\\rest': 's'}
+    assert run(ly.rests.replace_rests, TEXT, replacements) == "{ c4 8 s1*2 R2 s4 <f a>4  }"
+    # only in the range
+    text = "{ r4 d4 \\rest r4 e4 \\rest r4 }"
+    assert (run(ly.rests.replace_rests, text, replacements, start=5, end=text.index('e4'))
+            == "{ r4 s4 4 e4 \\rest r4 }")
@@ -0,0 +1,77 @@
+"""Tests for the duration manipulations in ly.rhythm."""
+import ly.document
+import ly.rhythm
+
+
+TEXT = "{ c4 d8. e16 f4*2/3 g \\tuplet 3/2 4 { a8 b c } \\tempo 4 = 60 r2 s1 }"
+
+
+def run(function, text, *args, **kwargs):
+    """Return text after calling function on a cursor over the range."""
+    d = ly.document.Document(text)
+    function(ly.document.Cursor(d, kwargs.get('start', 0), kwargs.get('end')), *args)
+    return d.plaintext()
+
+
+def test_double():
+    assert (run(ly.rhythm.rhythm_double, TEXT)
+            == "{ c2 d4. e8 f2*2/3 g \\tuplet 3/2 2 { a4 b c } \\tempo 2 = 60 r1 s\\breve }")
+
+
+def test_halve():
+    assert (run(ly.rhythm.rhythm_halve, TEXT)
+            == "{ c8 d16. e32 f8*2/3 g \\tuplet 3/2 8 { a16 b c } \\tempo 8 = 60 r4 s2 }")
+
+
+def test_dot():
+    assert (run(ly.rhythm.rhythm_dot, TEXT)
+            == "{ c4. d8.. e16. f4.*2/3 g \\tuplet 3/2 4. { a8. b c } \\tempo 4. = 60 r2. s1. }")
+
+
+def test_undot():
+    assert (run(ly.rhythm.rhythm_undot, "{ c4. d8.. e16 f4.*2/3 g }")
+            == "{ c4 d8. e16 f4*2/3 g }")
+
+
+def test_scale():
+    """The durations of \\tempo and \\tuplet are not scaled."""
+    assert (run(ly.rhythm.rhythm_scale, TEXT, 2, 3)
+            == "{ c4*2/3 d8.*2/3 e16*2/3 f4*4/9 g \\tuplet 3/2 4 { a8*2/3 b c } "
+               "\\tempo 4 = 60 r2*2/3 s1*2/3 }")
+    assert (run(ly.rhythm.rhythm_scale, TEXT, 3, 2)
+            == "{ c4*3/2 d8.*3/2 e16*3/2 f4 g \\tuplet 3/2 4 { a8*3/2 b c } "
+               "\\tempo 4 = 60 r2*3/2 s1*3/2 }")
+    # also at the start of the music
+    assert (run(ly.rhythm.rhythm_scale, "{ \\tuplet 3/2 4 { a8 b c } }", 2)
+            == "{ \\tuplet 3/2 4 { a8*2 b c } }")
+
+
+def test_implicit_durations():
+    """Notes without duration are left alone, also in a range."""
+    text = "{ c4 d e\n  f8 g }"
+    assert run(ly.rhythm.rhythm_double, text) == "{ c2 d e\n  f4 g }"
+    assert run(ly.rhythm.rhythm_double, text, start=5, end=14) == "{ c4 d e\n  f4 g }"
+
+
+def test_rewrite_durations():
+    """The transform is called once for every distinct duration."""
+    calls = []
+
+    def transform(tokens):
+        calls.append(tuple(tokens))
+        return [t + "~" if t == "8" else t for t in tokens]
+
+    text = "{ c8 d8 e4 f8\n  g8 a4 }"
+    assert run(ly.rhythm.rewrite_durations, text, transform) == "{ c8~ d8~ e4 f8~\n  g8~ a4 }"
+    assert sorted(calls) == [("4",), ("8",)]
+
+
+def test_write_blocks():
+    """Several changes in one block are applied at once."""
+    d = ly.document.Document("abc def ghi\njkl")
+    c = ly.document.Cursor(d, 5, 13)
+    d.write_blocks([(0, 1, "X"), (4, 5, "YY"), (8, 11, ""), (12, 13, "Z")])
+    assert d.plaintext() == "Xbc YYef \nZkl"
+    # cursor positions inside the replaced range of a block move to its
+    # start or end
+    assert (c.start, c.end) == (0, 11)